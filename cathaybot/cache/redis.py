@@ -13,11 +13,115 @@ from nonebot import logger
 from cathaybot.config import config
 
 
+class RedisPipeline:
+    """Redis Pipeline 封装
+
+    与 RedisClient 一致地添加键前缀并在 Redis 不可用时静默降级
+    （所有排队操作为空操作，execute() 返回空列表）。
+    排队方法不需要 await，最后统一 await execute() 一次性提交，
+    把 N 次网络往返合并为 1 次。
+    """
+
+    def __init__(self, client: Optional["redis.Redis"], prefix: str, transaction: bool = False):
+        self._client = client
+        self._pipe = client.pipeline(transaction=transaction) if client else None
+        self._prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self._prefix}{key}"
+
+    async def __aenter__(self) -> "RedisPipeline":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if self._pipe:
+            await self._pipe.reset()
+
+    # ---- 排队操作（返回 self 以便链式调用） ----
+
+    def get(self, key: str) -> "RedisPipeline":
+        if self._pipe:
+            self._pipe.get(self._key(key))
+        return self
+
+    def mget(self, keys: list[str]) -> "RedisPipeline":
+        if self._pipe:
+            self._pipe.mget([self._key(k) for k in keys])
+        return self
+
+    def set(self, key: str, value: str, expire: Optional[int] = None, nx: bool = False) -> "RedisPipeline":
+        if self._pipe:
+            self._pipe.set(self._key(key), value, ex=expire, nx=nx)
+        return self
+
+    def incr(self, key: str, amount: int = 1) -> "RedisPipeline":
+        if self._pipe:
+            self._pipe.incrby(self._key(key), amount)
+        return self
+
+    def hget(self, name: str, key: str) -> "RedisPipeline":
+        if self._pipe:
+            self._pipe.hget(self._key(name), key)
+        return self
+
+    def hmget(self, name: str, keys: list[str]) -> "RedisPipeline":
+        if self._pipe:
+            self._pipe.hmget(self._key(name), keys)
+        return self
+
+    def hgetall(self, name: str) -> "RedisPipeline":
+        if self._pipe:
+            self._pipe.hgetall(self._key(name))
+        return self
+
+    def hincrby(self, name: str, key: str, amount: int = 1) -> "RedisPipeline":
+        if self._pipe:
+            self._pipe.hincrby(self._key(name), key, amount)
+        return self
+
+    def lpush(self, name: str, *values: str) -> "RedisPipeline":
+        if self._pipe:
+            self._pipe.lpush(self._key(name), *values)
+        return self
+
+    def ltrim(self, name: str, start: int, end: int) -> "RedisPipeline":
+        if self._pipe:
+            self._pipe.ltrim(self._key(name), start, end)
+        return self
+
+    def expire(self, key: str, seconds: int, nx: bool = False) -> "RedisPipeline":
+        if self._pipe:
+            self._pipe.expire(self._key(key), seconds, nx=nx)
+        return self
+
+    def eval_script(self, script: str, keys: list[str], args: list) -> "RedisPipeline":
+        """排队执行 Lua 脚本（keys 自动添加前缀）
+
+        与 RedisClient.eval_script 共用注册缓存，排队的是 EVALSHA，
+        不会每条命令重传脚本体；脚本对象挂到 pipe.scripts 上，
+        execute 时由客户端库先补齐缺失的 SCRIPT LOAD。
+        """
+        if self._pipe:
+            cached = RedisClient._scripts.get(script)
+            if cached is None:
+                cached = RedisClient._scripts[script] = self._client.register_script(script)
+            self._pipe.scripts.add(cached)
+            self._pipe.evalsha(cached.sha, len(keys), *[self._key(k) for k in keys], *args)
+        return self
+
+    async def execute(self) -> list:
+        """提交所有排队的命令"""
+        if not self._pipe:
+            return []
+        return await self._pipe.execute()
+
+
 class RedisClient:
     """Redis 客户端封装"""
 
     _instance: Optional["RedisClient"] = None
     _client: Optional[redis.Redis] = None
+    _scripts: dict = {}
 
     def __new__(cls):
         if cls._instance is None:
@@ -35,11 +139,17 @@ class RedisClient:
             return
 
         try:
-            self._client = redis.from_url(
+            # 使用显式连接池 + RESP3。安装 hiredis 后 redis-py 自动启用
+            # C 实现的协议解析器，消息统计等热路径不再被纯 Python 解析拖慢
+            pool = redis.BlockingConnectionPool.from_url(
                 config.redis.url,
+                max_connections=config.redis.pool_size,
+                health_check_interval=config.redis.health_check_interval,
                 encoding="utf-8",
                 decode_responses=True,
+                protocol=3,
             )
+            self._client = redis.Redis(connection_pool=pool)
             await self._client.ping()
             logger.info(f"Redis 连接成功: {config.redis.url}")
         except Exception as e:
@@ -51,6 +161,7 @@ class RedisClient:
         if self._client:
             await self._client.close()
             self._client = None
+            self._scripts.clear()
 
     @property
     def is_connected(self) -> bool:
@@ -73,17 +184,30 @@ class RedisClient:
         key: str,
         value: str,
         expire: Optional[int] = None,
+        nx: bool = False,
     ) -> bool:
-        """设置值"""
+        """设置值（nx=True 时仅在键不存在时设置，可用作分布式锁）"""
         if not self._client:
             return False
-        await self._client.set(self._key(key), value, ex=expire)
-        return True
+        result = await self._client.set(self._key(key), value, ex=expire, nx=nx)
+        return bool(result)
 
     async def setex(self, key: str, seconds: int, value: str) -> bool:
         """设置值并指定过期时间（兼容方法）"""
         return await self.set(key, value, expire=seconds)
 
+    async def mget(self, keys: list[str]) -> list[Optional[str]]:
+        """批量获取值"""
+        if not self._client or not keys:
+            return [None] * len(keys)
+        return await self._client.mget([self._key(k) for k in keys])
+
+    async def getdel(self, key: str) -> Optional[str]:
+        """获取并删除键（原子操作，Redis 6.2+）"""
+        if not self._client:
+            return None
+        return await self._client.getdel(self._key(key))
+
     async def delete(self, key: str) -> bool:
         """删除键"""
         if not self._client:
@@ -131,6 +255,12 @@ class RedisClient:
             return 0
         return await self._client.hincrby(self._key(name), key, amount)
 
+    async def hmget(self, name: str, keys: list[str]) -> list[Optional[str]]:
+        """批量获取 Hash 字段（一条命令取多个字段）"""
+        if not self._client or not keys:
+            return [None] * len(keys)
+        return await self._client.hmget(self._key(name), keys)
+
     async def hgetall(self, name: str) -> dict[str, str]:
         """获取所有 Hash 字段"""
         if not self._client:
@@ -143,6 +273,26 @@ class RedisClient:
             return 0
         return await self._client.hdel(self._key(name), *keys)
 
+    # ==================== Set 操作 ====================
+
+    async def sadd(self, name: str, *values: str) -> int:
+        """添加到集合"""
+        if not self._client:
+            return 0
+        return await self._client.sadd(self._key(name), *values)
+
+    async def smembers(self, name: str) -> set[str]:
+        """获取集合所有成员"""
+        if not self._client:
+            return set()
+        return await self._client.smembers(self._key(name))
+
+    async def srem(self, name: str, *values: str) -> int:
+        """从集合删除成员"""
+        if not self._client:
+            return 0
+        return await self._client.srem(self._key(name), *values)
+
     # ==================== Sorted Set 操作 ====================
 
     async def zadd(self, name: str, mapping: dict[str, float]) -> int:
@@ -210,13 +360,28 @@ class RedisClient:
         await self._client.ltrim(self._key(name), start, end)
         return True
 
+    # ==================== Lua 脚本 ====================
+
+    async def eval_script(self, script: str, keys: list[str], args: list) -> Any:
+        """执行 Lua 脚本（keys 自动添加前缀）
+
+        脚本首次使用时通过 SCRIPT LOAD 注册，之后走 EVALSHA，
+        避免每次调用都传输脚本体。
+        """
+        if not self._client:
+            return None
+        cached = self._scripts.get(script)
+        if cached is None:
+            cached = self._scripts[script] = self._client.register_script(script)
+        return await cached(keys=[self._key(k) for k in keys], args=args)
+
     # ==================== 过期时间 ====================
 
-    async def expire(self, key: str, seconds: int) -> bool:
-        """设置过期时间"""
+    async def expire(self, key: str, seconds: int, nx: bool = False) -> bool:
+        """设置过期时间（nx=True 时仅在键没有 TTL 时设置，Redis 7+）"""
         if not self._client:
             return False
-        return await self._client.expire(self._key(key), seconds)
+        return await self._client.expire(self._key(key), seconds, nx=nx)
 
     async def ttl(self, key: str) -> int:
         """获取剩余过期时间"""
@@ -226,8 +391,12 @@ class RedisClient:
 
     # ==================== 批量操作 ====================
 
+    def pipeline(self, transaction: bool = False) -> RedisPipeline:
+        """创建 Pipeline，批量提交命令以减少网络往返"""
+        return RedisPipeline(self._client, self.prefix, transaction=transaction)
+
     async def keys(self, pattern: str) -> list[str]:
-        """获取匹配的键"""
+        """获取匹配的键（KEYS，阻塞整个服务端，仅限小键空间/调试用）"""
         if not self._client:
             return []
         full_pattern = self._key(pattern)
@@ -236,6 +405,16 @@ class RedisClient:
         prefix_len = len(self.prefix)
         return [k[prefix_len:] for k in keys]
 
+    async def scan_keys(self, pattern: str, count: int = 2000) -> list[str]:
+        """获取匹配的键（SCAN 增量遍历，不长时间阻塞服务端）"""
+        if not self._client:
+            return []
+        prefix_len = len(self.prefix)
+        keys = []
+        async for k in self._client.scan_iter(match=self._key(pattern), count=count):
+            keys.append(k[prefix_len:])
+        return keys
+
     async def delete_pattern(self, pattern: str) -> int:
         """删除匹配的键"""
         if not self._client:
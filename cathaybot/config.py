@@ -57,6 +57,10 @@ class RedisConfig(BaseModel):
     url: str = Field(default="redis://localhost:6379/0", description="Redis 连接 URL")
     prefix: str = Field(default="cathaybot:", description="键前缀")
 
+    # 连接池配置
+    pool_size: int = Field(default=32, description="连接池最大连接数")
+    health_check_interval: int = Field(default=30, description="空闲连接健康检查间隔(秒)")
+
     # 缓存配置
     sync_interval: int = Field(default=300, description="同步到数据库的间隔(秒)")
     expire_hours: int = Field(default=24, description="统计数据过期时间(小时)")
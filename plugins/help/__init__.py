@@ -14,7 +14,13 @@ from nonebot.params import CommandArg
 from nonebot.plugin import PluginMetadata
 
 from .config import Config
-from .templates import HELP_LIST_TEMPLATE, HELP_DETAIL_TEMPLATE, CATEGORY_ICONS
+from .templates import (
+    HELP_LIST_TEMPLATE,
+    HELP_DETAIL_TEMPLATE,
+    HELP_LIST_CSS,
+    HELP_DETAIL_CSS,
+    CATEGORY_ICONS,
+)
 
 __plugin_meta__ = PluginMetadata(
     name="帮助",
@@ -180,6 +186,7 @@ async def handle_help(matcher: Matcher, args: Message = CommandArg()):
         else:
             img = await render_image(
                 HELP_LIST_TEMPLATE,
+                css=HELP_LIST_CSS,
                 categories=categories,
                 total=total,
             )
@@ -200,6 +207,7 @@ async def handle_help(matcher: Matcher, args: Message = CommandArg()):
         else:
             img = await render_image(
                 HELP_DETAIL_TEMPLATE,
+                css=HELP_DETAIL_CSS,
                 **detail,
             )
             if img:
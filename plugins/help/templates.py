@@ -2,12 +2,9 @@
 Help 插件 HTML 模板
 """
 
-HELP_LIST_TEMPLATE = """
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <style>
+# 插件列表模板的静态 CSS（渲染时以 {{ css|safe }} 注入，
+# 避免 Jinja 每次解析模板都要重新词法分析整段样式）
+HELP_LIST_CSS = """
         * {
             margin: 0;
             padding: 0;
@@ -110,47 +107,10 @@ HELP_LIST_TEMPLATE = """
             color: #d46b08;
             margin-top: 16px;
         }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>📚 帮助菜单</h1>
-            <div class="subtitle">共 {{ total }} 个插件</div>
-        </div>
-        {% for category, plugins in categories.items() %}
-        <div class="category">
-            <div class="category-title">{{ category }}</div>
-            <ul class="plugin-list">
-                {% for plugin in plugins %}
-                <li class="plugin-item">
-                    <div class="plugin-icon">{{ plugin.icon }}</div>
-                    <div class="plugin-info">
-                        <div class="plugin-name">{{ plugin.name }}</div>
-                        <div class="plugin-desc">{{ plugin.description }}</div>
-                    </div>
-                </li>
-                {% endfor %}
-            </ul>
-        </div>
-        {% endfor %}
-        <div class="tip">
-            💡 使用 /help &lt;插件名&gt; 查看详细用法
-        </div>
-        <div class="footer">
-            CathayBot · {{ time }}
-        </div>
-    </div>
-</body>
-</html>
 """
 
-HELP_DETAIL_TEMPLATE = """
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <style>
+# 插件详情模板的静态 CSS
+HELP_DETAIL_CSS = """
         * {
             margin: 0;
             padding: 0;
@@ -231,7 +191,54 @@ HELP_DETAIL_TEMPLATE = """
             font-size: 12px;
             color: #aaa;
         }
-    </style>
+"""
+
+HELP_LIST_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <style>{{ css|safe }}</style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>📚 帮助菜单</h1>
+            <div class="subtitle">共 {{ total }} 个插件</div>
+        </div>
+        {% for category, plugins in categories.items() %}
+        <div class="category">
+            <div class="category-title">{{ category }}</div>
+            <ul class="plugin-list">
+                {% for plugin in plugins %}
+                <li class="plugin-item">
+                    <div class="plugin-icon">{{ plugin.icon }}</div>
+                    <div class="plugin-info">
+                        <div class="plugin-name">{{ plugin.name }}</div>
+                        <div class="plugin-desc">{{ plugin.description }}</div>
+                    </div>
+                </li>
+                {% endfor %}
+            </ul>
+        </div>
+        {% endfor %}
+        <div class="tip">
+            💡 使用 /help &lt;插件名&gt; 查看详细用法
+        </div>
+        <div class="footer">
+            CathayBot · {{ time }}
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+HELP_DETAIL_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <style>{{ css|safe }}</style>
 </head>
 <body>
     <div class="container">
@@ -5,21 +5,41 @@ Statistics 插件 - 发言/调用统计
 支持图片和文字输出。
 """
 
+import asyncio
+import base64
+import hashlib
 import json
-from datetime import datetime
+import string
+import time
+from datetime import datetime, timedelta
+from html import escape as _esc
 
-from nonebot import get_driver, on_command, on_message
+from nonebot import get_driver, logger, on_command, on_message, on_notice
 from nonebot.adapters.onebot.v11 import (
     Bot,
     Message,
     MessageEvent,
     GroupMessageEvent,
+    GroupDecreaseNoticeEvent,
     MessageSegment,
+    NoticeEvent,
 )
 from nonebot.matcher import Matcher
 from nonebot.params import CommandArg
+from nonebot.rule import Rule
 from nonebot.plugin import PluginMetadata
 
+try:
+    import orjson
+
+    def _json_dumps(obj) -> bytes:
+        """序列化为 UTF-8 字节（orjson，约快 2-10 倍）"""
+        return orjson.dumps(obj)
+except ImportError:
+    def _json_dumps(obj) -> bytes:
+        """序列化为 UTF-8 字节（标准库回退）"""
+        return json.dumps(obj, ensure_ascii=False).encode()
+
 from cathaybot.cache import redis_client
 
 from .config import Config
@@ -57,95 +77,242 @@ driver = get_driver()
 #
 # 统计数据 Key 结构:
 #   stat:msg:daily:{date}:{group_id}     -> Hash { user_id: count }  今日群消息统计
-#   stat:msg:user:{user_id}:daily        -> Hash { date: count }  用户每日消息数
+#       （刻意按 (date, group) 拆分：单个 Hash 字段数少，保持 listpack
+#         紧凑编码；排行查询按群取整个 Hash、同步按天扫描、过期按键
+#         整体淘汰。合并成每天一个大 Hash 会超出 listpack 阈值退化为
+#         hashtable，反而失去紧凑编码）
+#   stat:msg:user:{user_id}:{date}       -> String count  用户每日消息数（按天过期）
+#   stat:zmsg:daily:{date}:{group_id}    -> ZSet { user_id: count }  今日排行（与 Hash 双写，
+#                                           ZREVRANGE 服务端取前 K，传输量 O(K)）
 #   stat:cmd:daily:{date}                -> Hash { plugin_name: count }  今日命令统计
 #   stat:cmd:user:{user_id}:daily        -> Hash { date: count }  用户每日命令数
 #
+# 索引 Key（写入时维护，读取侧借此免扫描键空间）:
+#   stat:index:daily:{date}              -> Set { group_id }  当日有消息的群
+#   stat:index:dates:{group_id}          -> Set { date }  群尚存增量数据的日期
+#
 # 聊天记录 Key 结构:
 #   chat:group:{group_id}:messages       -> List [json_message, ...]  群聊消息列表
 #   chat:private:{user_id}:messages      -> List [json_message, ...]  私聊消息列表
 #
 
 
+# 统计键保留时长（模块级常量，不在每条消息里重算）
+_EXPIRE_MSG = 7 * 24 * 3600
+_EXPIRE_CMD = 30 * 24 * 3600
+
+# 当天日期字符串缓存: (失效时间戳, 字符串)。
+# 高频路径上每条消息都要取日期 key，只在跨天时才真正 strftime
+_date_cache: tuple[float, str] = (0.0, "")
+
+
 def get_date_key(dt: datetime = None) -> str:
     """获取日期 key (YYYY-MM-DD)"""
-    if dt is None:
-        dt = datetime.now()
-    return dt.strftime("%Y-%m-%d")
+    global _date_cache
+    if dt is not None:
+        return dt.strftime("%Y-%m-%d")
+    now = time.time()
+    expires, cached = _date_cache
+    if now >= expires:
+        lt = time.localtime(now)
+        cached = time.strftime("%Y-%m-%d", lt)
+        seconds_today = lt.tm_hour * 3600 + lt.tm_min * 60 + lt.tm_sec
+        _date_cache = (now + 86400 - seconds_today, cached)
+    return cached
+
+
+# 排行榜前三名奖牌（模块级常量，避免每次调用重建）
+_MEDALS = {1: "🥇", 2: "🥈", 3: "🥉"}
+
+
+# LPUSH + LTRIM 合并为一段 Lua：服务端原子执行，一条命令完成
+# 追加和裁剪，并发写入也不会让列表瞬时超出上限
+_LPUSH_TRIM_SCRIPT = """
+redis.call('LPUSH', KEYS[1], ARGV[1])
+redis.call('LTRIM', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+return redis.status_reply('OK')
+"""
+
+
+# ==================== 微批量写入 ====================
+#
+# 记录类写操作不直接 await Redis，而是投递到进程内队列，
+# 由后台任务按小时间窗口 + 批量上限合并成一个大 Pipeline 提交：
+# 突发的 100 条消息从 100 次网络往返收敛为 1 次。
+# 代价是写入有几十毫秒的滞后，对统计数据无影响。
+
+_FLUSH_INTERVAL = 0.05  # 聚合窗口（秒）
+_MAX_BATCH = 200  # 单次 Pipeline 最多合并的消息数
+
+_pending: asyncio.Queue = asyncio.Queue()
+_flusher_task: asyncio.Task | None = None
+
+
+def _enqueue(ops: list[tuple]) -> None:
+    """投递一组 (方法名, 参数) Pipeline 操作，由后台任务合并提交"""
+    _pending.put_nowait(ops)
+
+
+# 计数 + TTL 合并为一段 Lua：每条消息/命令只占 Pipeline 一条命令，
+# 服务端少解析 3 条协议；EXPIRE NX 在脚本内执行，零额外往返，
+# 仍保持"TTL 只在键创建时设置一次"的语义。
+# KEYS[2]（群统计 Hash）可选，私聊消息只传 KEYS[1]
+# 群消息额外维护两个 Set 索引：当日活跃群、群的增量日期，
+# 让同步和总榜查询直接 SMEMBERS 拿到精确键名，不必 SCAN 键空间
+_MSG_COUNTERS_SCRIPT = """
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2], 'NX')
+if KEYS[2] then
+    redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+    redis.call('EXPIRE', KEYS[2], ARGV[2], 'NX')
+    redis.call('SADD', KEYS[3], ARGV[3])
+    redis.call('EXPIRE', KEYS[3], ARGV[2], 'NX')
+    redis.call('SADD', KEYS[4], ARGV[4])
+    redis.call('EXPIRE', KEYS[4], ARGV[2] * 5)
+    redis.call('ZINCRBY', KEYS[5], 1, ARGV[1])
+    redis.call('EXPIRE', KEYS[5], ARGV[2], 'NX')
+end
+return redis.status_reply('OK')
+"""
+
+# 用户命令 Hash 是滚动键，整键 TTL 只在创建时设置，旧日期字段
+# 需要单独过期：Redis >= 7.4 用 HEXPIRE 给字段挂 TTL（pcall 包裹，
+# 旧版本报错即忽略），更旧的服务端靠同步任务的每日裁剪兜底
+_CMD_COUNTERS_SCRIPT = """
+redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+redis.call('EXPIRE', KEYS[1], ARGV[3], 'NX')
+redis.call('EXPIRE', KEYS[2], ARGV[3], 'NX')
+redis.pcall('HEXPIRE', KEYS[2], ARGV[3], 'FIELDS', 1, ARGV[2])
+return redis.status_reply('OK')
+"""
+
+
+async def _flush(ops_batch: list[list[tuple]]) -> None:
+    """把多组排队操作重放到一个 Pipeline 并提交"""
+    pipe = redis_client.pipeline()
+    for ops in ops_batch:
+        for method, args in ops:
+            getattr(pipe, method)(*args)
+    await pipe.execute()
+
+
+async def _flusher() -> None:
+    """后台批量提交循环"""
+    while True:
+        ops_batch = [await _pending.get()]
+        try:
+            # 短暂等待，让同一突发内的后续消息进入本批
+            await asyncio.sleep(_FLUSH_INTERVAL)
+            while len(ops_batch) < _MAX_BATCH and not _pending.empty():
+                ops_batch.append(_pending.get_nowait())
+        except asyncio.CancelledError:
+            # 停机收尾：本批已经出队，不在这里写掉就随任务一起丢了；
+            # 还留在队列里的由 _stop_flusher 负责
+            try:
+                await _flush(ops_batch)
+            except Exception as e:
+                logger.warning(f"停机前批量写入失败: {e}")
+            raise
+        try:
+            await _flush(ops_batch)
+        except Exception as e:
+            logger.warning(f"统计数据批量写入失败: {e}")
+
+
+@driver.on_startup
+async def _start_flusher():
+    global _flusher_task
+    _flusher_task = asyncio.create_task(_flusher())
+
+
+@driver.on_shutdown
+async def _stop_flusher():
+    if _flusher_task:
+        _flusher_task.cancel()
+        # 必须等任务真正退出：它会在取消处理里先写完已出队的本批，
+        # 只发 cancel 不等待的话，最近一批写入就丢了
+        try:
+            await _flusher_task
+        except asyncio.CancelledError:
+            pass
+    # 退出前把剩余排队操作刷掉，避免丢数据
+    rest = []
+    while not _pending.empty():
+        rest.append(_pending.get_nowait())
+    if rest:
+        await _flush(rest)
 
 
 # ==================== 消息记录 (Redis) ====================
 
-msg_recorder = on_message(priority=99, block=False)
+
+def _track_rule() -> bool:
+    """关闭消息统计时让 NoneBot 直接跳过匹配，连 handler 调度都省掉"""
+    return plugin_config.track_messages
+
+
+msg_recorder = on_message(rule=Rule(_track_rule), priority=99, block=False)
 
 
 @msg_recorder.handle()
 async def record_message(event: MessageEvent):
     """记录消息到 Redis"""
-    if not plugin_config.track_messages:
-        return
-
     user_id = str(event.user_id)
     date_key = get_date_key()
 
-    if isinstance(event, GroupMessageEvent):
-        group_id = str(event.group_id)
+    # 所有写操作投递给后台批量任务，本 handler 不再等待 Redis
+    ops: list[tuple] = []
 
-        # 群消息统计: stat:msg:daily:{date}:{group_id} -> { user_id: count }
-        await redis_client.hincrby(f"stat:msg:daily:{date_key}:{group_id}", user_id, 1)
-
-        # 保存聊天记录到 Redis List
-        if plugin_config.save_chat_history:
-            msg_data = {
-                "id": str(event.message_id),
-                "user_id": user_id,
-                "user_name": event.sender.nickname or user_id,
-                "content": str(event.message),
-                "raw": event.raw_message,
-                "time": datetime.now().isoformat(),
-            }
-            await redis_client.lpush(
-                f"chat:group:{group_id}:messages",
-                json.dumps(msg_data, ensure_ascii=False)
-            )
-            # 限制列表长度，保留最近 N 条 (0=不限制)
-            if plugin_config.max_messages_per_chat > 0:
-                await redis_client.ltrim(
-                    f"chat:group:{group_id}:messages",
-                    0,
-                    plugin_config.max_messages_per_chat - 1
-                )
-    else:
-        # 私聊消息
-        if plugin_config.save_chat_history:
-            msg_data = {
-                "id": str(event.message_id),
-                "user_id": user_id,
-                "user_name": event.sender.nickname or user_id,
-                "content": str(event.message),
-                "raw": event.raw_message,
-                "time": datetime.now().isoformat(),
-            }
-            await redis_client.lpush(
-                f"chat:private:{user_id}:messages",
-                json.dumps(msg_data, ensure_ascii=False)
-            )
-            # 限制列表长度，保留最近 N 条 (0=不限制)
-            if plugin_config.max_messages_per_chat > 0:
-                await redis_client.ltrim(
-                    f"chat:private:{user_id}:messages",
-                    0,
-                    plugin_config.max_messages_per_chat - 1
-                )
+    is_group = isinstance(event, GroupMessageEvent)
 
-    # 用户总消息统计
-    await redis_client.hincrby(f"stat:msg:user:{user_id}:daily", date_key, 1)
+    # 用户每日计数 + 群消息统计 + 索引维护 + TTL 合并为一次脚本调用
+    counter_keys = [f"stat:msg:user:{user_id}:{date_key}"]
+    counter_args = [user_id, _EXPIRE_MSG]
+    if is_group:
+        group_id = str(event.group_id)
+        counter_keys += [
+            f"stat:msg:daily:{date_key}:{group_id}",
+            f"stat:index:daily:{date_key}",
+            f"stat:index:dates:{group_id}",
+            f"stat:zmsg:daily:{date_key}:{group_id}",
+        ]
+        counter_args += [group_id, date_key]
+    ops.append(("eval_script", (_MSG_COUNTERS_SCRIPT, counter_keys, counter_args)))
+
+    # 保存聊天记录到 Redis List（群聊/私聊只差 key，消息体只构建一次）
+    if plugin_config.save_chat_history:
+        msg_data = {
+            "id": str(event.message_id),
+            "user_id": user_id,
+            "user_name": event.sender.nickname or user_id,
+            "content": str(event.message),
+            "raw": event.raw_message,
+            "time": datetime.now().isoformat(),
+        }
+        chat_key = (
+            f"chat:group:{group_id}:messages"
+            if is_group
+            else f"chat:private:{user_id}:messages"
+        )
+        # orjson 直接产出 UTF-8 字节，Redis LPUSH 原样接受。
+        # 限制长度时走 Lua 脚本，追加 + 裁剪一条命令原子完成 (0=不限制)
+        if plugin_config.max_messages_per_chat > 0:
+            ops.append((
+                "eval_script",
+                (
+                    _LPUSH_TRIM_SCRIPT,
+                    [chat_key],
+                    [_json_dumps(msg_data), plugin_config.max_messages_per_chat],
+                ),
+            ))
+        else:
+            ops.append(("lpush", (chat_key, _json_dumps(msg_data))))
+        # 脏标记：同步循环据此判断有无新聊天记录要落库，
+        # 空闲时段整个扫描-同步流程直接跳过
+        ops.append(("set", ("stat:dirty:chat", "1")))
 
-    # 设置过期时间 (7天后自动清理)
-    expire_seconds = 7 * 24 * 3600
-    if isinstance(event, GroupMessageEvent):
-        await redis_client.expire(f"stat:msg:daily:{date_key}:{group_id}", expire_seconds)
-    await redis_client.expire(f"stat:msg:user:{user_id}:daily", expire_seconds)
+    _enqueue(ops)
 
 
 # ==================== 统计命令 ====================
@@ -155,9 +322,17 @@ stat_cmd = on_command("stat", aliases={"统计"}, priority=10, block=True)
 
 def parse_raw_flag(args: str) -> tuple[str, bool]:
     """解析 --raw 参数"""
-    raw_mode = "--raw" in args
-    clean_args = args.replace("--raw", "").strip()
-    return clean_args, raw_mode
+    # partition 只扫描一次字符串，代替 in + replace 的两次扫描
+    head, sep, tail = args.partition("--raw")
+    return (head + tail).strip(), bool(sep)
+
+
+# 渲染结果缓存: 内容摘要 -> (过期时间戳, PNG 字节)。
+# /stat 输出由 (标题, 副标题, 数据项, 模板) 唯一确定，同一分钟内
+# 重复查询直接复用 PNG，省掉几百毫秒的 Chromium 截图
+_IMG_CACHE_TTL = 60
+_IMG_CACHE_MAX = 256
+_img_cache: dict[str, tuple[float, bytes]] = {}
 
 
 async def render_image(title: str, subtitle: str, items: list[dict], template_type: str = "rank") -> bytes | None:
@@ -169,6 +344,14 @@ async def render_image(title: str, subtitle: str, items: list[dict], template_ty
         items: 数据项列表
         template_type: 模板类型 (rank/user/plugin)
     """
+    cache_key = hashlib.sha1(
+        json.dumps([title, subtitle, items, template_type], sort_keys=True).encode()
+    ).hexdigest()
+    now = time.monotonic()
+    cached = _img_cache.get(cache_key)
+    if cached and cached[0] > now:
+        return cached[1]
+
     try:
         from nonebot_plugin_htmlrender import html_to_pic
 
@@ -180,136 +363,196 @@ async def render_image(title: str, subtitle: str, items: list[dict], template_ty
         else:
             html = _build_rank_html(title, subtitle, items)
 
-        return await html_to_pic(html=html, viewport={"width": 450, "height": 100})
+        # 统计图不需要 2x 视网膜分辨率，scale=1 像素量减 4 倍；
+        # JPEG Q85 对这类渐变背景比 PNG 小 5-10 倍，编码也快得多
+        viewport = {"width": 450, "height": 100}
+        try:
+            img = await html_to_pic(
+                html=html,
+                viewport=viewport,
+                device_scale_factor=1,
+                type="jpeg",
+                quality=85,
+            )
+        except TypeError:
+            # 旧版 htmlrender 不认识 device_scale_factor/type/quality 参数
+            img = await html_to_pic(html=html, viewport=viewport)
     except ImportError:
         return None
     except Exception:
         return None
 
+    if len(_img_cache) >= _IMG_CACHE_MAX:
+        _img_cache.clear()
+    _img_cache[cache_key] = (now + _IMG_CACHE_TTL, img)
+    return img
+
+
+# 页面骨架（含整段 CSS）在导入时构建为 string.Template，
+# 每次调用只替换 title/subtitle/items_html/time_str 四个占位符，
+# 不再逐次重建约 1.5 KB 的静态样式字符串
+
+# 三张页面完全相同的基础样式只保留一份，导入时拼进各骨架：
+# 源码少两份重复文本，发给无头浏览器的字节也相应减少
+_BASE_CSS = '''
+        * { margin: 0; padding: 0; box-sizing: border-box; }
+        .container { background: white; border-radius: 16px; padding: 24px; box-shadow: 0 10px 40px rgba(0,0,0,0.2); }
+        .header { text-align: center; margin-bottom: 20px; padding-bottom: 16px; border-bottom: 2px solid #f0f0f0; }
+        .header h1 { font-size: 24px; color: #333; margin-bottom: 8px; }
+        .header .subtitle { font-size: 14px; color: #888; }
+        .footer { text-align: center; margin-top: 16px; padding-top: 16px; border-top: 1px solid #f0f0f0; font-size: 12px; color: #aaa; }
+        .empty { text-align: center; padding: 40px; color: #888; }'''
+
+_PAGE_HEAD = '''<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <style>''' + _BASE_CSS
+
+_RANK_PAGE = string.Template(_PAGE_HEAD + '''
+        body { font-family: "Microsoft YaHei", "PingFang SC", sans-serif; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; min-width: 400px; }
+        .rank-list { list-style: none; }
+        .rank-item { display: flex; align-items: center; padding: 12px 16px; margin-bottom: 8px; background: #f8f9fa; border-radius: 12px; transition: transform 0.2s; }
+        .rank-item:hover { transform: translateX(4px); }
+        .rank-num { width: 32px; height: 32px; border-radius: 50%; display: flex; align-items: center; justify-content: center; font-weight: bold; font-size: 14px; margin-right: 12px; }
+        .rank-1 .rank-num { background: linear-gradient(135deg, #FFD700, #FFA500); color: white; }
+        .rank-2 .rank-num { background: linear-gradient(135deg, #C0C0C0, #A0A0A0); color: white; }
+        .rank-3 .rank-num { background: linear-gradient(135deg, #CD7F32, #8B4513); color: white; }
+        .rank-other .rank-num { background: #e0e0e0; color: #666; }
+        .rank-info { flex: 1; }
+        .rank-name { font-size: 16px; font-weight: 500; color: #333; }
+        .rank-detail { font-size: 12px; color: #888; margin-top: 2px; }
+        .rank-count { font-size: 18px; font-weight: bold; color: #667eea; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>$title</h1>
+            <div class="subtitle">$subtitle</div>
+        </div>
+        <ul class="rank-list">$items_html</ul>
+        <div class="footer">CathayBot Statistics · $time_str</div>
+    </div>
+</body>
+</html>''')
+
 
 def _build_rank_html(title: str, subtitle: str, items: list[dict]) -> str:
     """构建排行榜 HTML"""
     time_str = datetime.now().strftime("%Y-%m-%d %H:%M")
 
-    items_html = ""
-    if items:
-        for i, item in enumerate(items, 1):
-            rank_class = f"rank-{i}" if i <= 3 else "rank-other"
-            detail_html = f'<div class="rank-detail">{item["detail"]}</div>' if item.get("detail") else ""
-            items_html += f'''
+    # 片段收集进列表后一次 join，避免 += 反复拷贝整段字符串。
+    # 名次样式类预先铺成列表，循环里纯下标取值，不再逐行判断 + 格式化。
+    # 昵称/详情来自用户可控输入，插入 HTML 前必须转义
+    rank_classes = ["rank-1", "rank-2", "rank-3"] + ["rank-other"] * max(len(items) - 3, 0)
+    fragments = []
+    for i, (item, rank_class) in enumerate(zip(items, rank_classes), 1):
+        detail = item.get("detail")
+        detail_html = f'<div class="rank-detail">{_esc(detail, quote=False)}</div>' if detail else ""
+        fragments.append(f'''
             <li class="rank-item {rank_class}">
                 <div class="rank-num">{i}</div>
                 <div class="rank-info">
-                    <div class="rank-name">{item["name"]}</div>
+                    <div class="rank-name">{_esc(item["name"], quote=False)}</div>
                     {detail_html}
                 </div>
                 <div class="rank-count">{item["count"]}</div>
             </li>
-            '''
-    else:
-        items_html = '<div class="empty">暂无数据</div>'
-
-    return f'''<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{ font-family: "Microsoft YaHei", "PingFang SC", sans-serif; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; min-width: 400px; }}
-        .container {{ background: white; border-radius: 16px; padding: 24px; box-shadow: 0 10px 40px rgba(0,0,0,0.2); }}
-        .header {{ text-align: center; margin-bottom: 20px; padding-bottom: 16px; border-bottom: 2px solid #f0f0f0; }}
-        .header h1 {{ font-size: 24px; color: #333; margin-bottom: 8px; }}
-        .header .subtitle {{ font-size: 14px; color: #888; }}
-        .rank-list {{ list-style: none; }}
-        .rank-item {{ display: flex; align-items: center; padding: 12px 16px; margin-bottom: 8px; background: #f8f9fa; border-radius: 12px; transition: transform 0.2s; }}
-        .rank-item:hover {{ transform: translateX(4px); }}
-        .rank-num {{ width: 32px; height: 32px; border-radius: 50%; display: flex; align-items: center; justify-content: center; font-weight: bold; font-size: 14px; margin-right: 12px; }}
-        .rank-1 .rank-num {{ background: linear-gradient(135deg, #FFD700, #FFA500); color: white; }}
-        .rank-2 .rank-num {{ background: linear-gradient(135deg, #C0C0C0, #A0A0A0); color: white; }}
-        .rank-3 .rank-num {{ background: linear-gradient(135deg, #CD7F32, #8B4513); color: white; }}
-        .rank-other .rank-num {{ background: #e0e0e0; color: #666; }}
-        .rank-info {{ flex: 1; }}
-        .rank-name {{ font-size: 16px; font-weight: 500; color: #333; }}
-        .rank-detail {{ font-size: 12px; color: #888; margin-top: 2px; }}
-        .rank-count {{ font-size: 18px; font-weight: bold; color: #667eea; }}
-        .footer {{ text-align: center; margin-top: 16px; padding-top: 16px; border-top: 1px solid #f0f0f0; font-size: 12px; color: #aaa; }}
-        .empty {{ text-align: center; padding: 40px; color: #888; }}
+            ''')
+    items_html = "".join(fragments) if fragments else '<div class="empty">暂无数据</div>'
+
+    return _RANK_PAGE.substitute(
+        title=_esc(title, quote=False),
+        subtitle=_esc(subtitle, quote=False),
+        items_html=items_html,
+        time_str=time_str,
+    )
+
+
+_USER_STAT_PAGE = string.Template(_PAGE_HEAD + '''
+        body { font-family: "Microsoft YaHei", "PingFang SC", sans-serif; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; min-width: 400px; }
+        .stats-grid { display: grid; grid-template-columns: repeat(2, 1fr); gap: 12px; }
+        .stat-card { background: linear-gradient(135deg, #f8f9fa 0%, #e9ecef 100%); border-radius: 12px; padding: 16px; text-align: center; transition: transform 0.2s; }
+        .stat-card:hover { transform: translateY(-2px); }
+        .stat-card.highlight { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; grid-column: span 2; }
+        .stat-label { font-size: 14px; color: #666; margin-bottom: 8px; }
+        .stat-card.highlight .stat-label { color: rgba(255,255,255,0.9); }
+        .stat-value { font-size: 28px; font-weight: bold; color: #667eea; }
+        .stat-card.highlight .stat-value { color: white; font-size: 32px; }
     </style>
 </head>
 <body>
     <div class="container">
         <div class="header">
-            <h1>{title}</h1>
-            <div class="subtitle">{subtitle}</div>
+            <h1>$title</h1>
+            <div class="subtitle">$subtitle</div>
         </div>
-        <ul class="rank-list">{items_html}</ul>
-        <div class="footer">CathayBot Statistics · {time_str}</div>
+        <div class="stats-grid">$items_html</div>
+        <div class="footer">CathayBot Statistics · $time_str</div>
     </div>
 </body>
-</html>'''
+</html>''')
 
 
 def _build_user_stat_html(title: str, subtitle: str, items: list[dict]) -> str:
     """构建用户统计 HTML"""
     time_str = datetime.now().strftime("%Y-%m-%d %H:%M")
 
-    items_html = ""
-    for item in items:
-        highlight_class = "highlight" if item["name"] == "总发言" else ""
-        items_html += f'''
-        <div class="stat-card {highlight_class}">
-            <div class="stat-label">{item["name"]}</div>
+    items_html = "".join(
+        f'''
+        <div class="stat-card {"highlight" if item["name"] == "总发言" else ""}">
+            <div class="stat-label">{_esc(item["name"], quote=False)}</div>
             <div class="stat-value">{item["count"]}</div>
         </div>
         '''
-
-    return f'''<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{ font-family: "Microsoft YaHei", "PingFang SC", sans-serif; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; min-width: 400px; }}
-        .container {{ background: white; border-radius: 16px; padding: 24px; box-shadow: 0 10px 40px rgba(0,0,0,0.2); }}
-        .header {{ text-align: center; margin-bottom: 20px; padding-bottom: 16px; border-bottom: 2px solid #f0f0f0; }}
-        .header h1 {{ font-size: 24px; color: #333; margin-bottom: 8px; }}
-        .header .subtitle {{ font-size: 14px; color: #888; }}
-        .stats-grid {{ display: grid; grid-template-columns: repeat(2, 1fr); gap: 12px; }}
-        .stat-card {{ background: linear-gradient(135deg, #f8f9fa 0%, #e9ecef 100%); border-radius: 12px; padding: 16px; text-align: center; transition: transform 0.2s; }}
-        .stat-card:hover {{ transform: translateY(-2px); }}
-        .stat-card.highlight {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; grid-column: span 2; }}
-        .stat-label {{ font-size: 14px; color: #666; margin-bottom: 8px; }}
-        .stat-card.highlight .stat-label {{ color: rgba(255,255,255,0.9); }}
-        .stat-value {{ font-size: 28px; font-weight: bold; color: #667eea; }}
-        .stat-card.highlight .stat-value {{ color: white; font-size: 32px; }}
-        .footer {{ text-align: center; margin-top: 16px; padding-top: 16px; border-top: 1px solid #f0f0f0; font-size: 12px; color: #aaa; }}
+        for item in items
+    )
+
+    # 标题含用户昵称，同样需要转义
+    return _USER_STAT_PAGE.substitute(
+        title=_esc(title, quote=False),
+        subtitle=_esc(subtitle, quote=False),
+        items_html=items_html,
+        time_str=time_str,
+    )
+
+
+_PLUGIN_STAT_PAGE = string.Template(_PAGE_HEAD + '''
+        body { font-family: "Microsoft YaHei", "PingFang SC", sans-serif; background: linear-gradient(135deg, #11998e 0%, #38ef7d 100%); padding: 20px; min-width: 400px; }
+        .plugin-list { list-style: none; }
+        .plugin-item { display: flex; align-items: center; padding: 14px 16px; margin-bottom: 10px; background: #f8f9fa; border-radius: 12px; border-left: 4px solid #11998e; transition: all 0.2s; }
+        .plugin-item:hover { transform: translateX(4px); box-shadow: 0 4px 12px rgba(0,0,0,0.1); }
+        .plugin-icon { width: 40px; height: 40px; border-radius: 10px; background: linear-gradient(135deg, #11998e 0%, #38ef7d 100%); display: flex; align-items: center; justify-content: center; font-size: 20px; margin-right: 12px; }
+        .plugin-info { flex: 1; }
+        .plugin-name { font-size: 16px; font-weight: 500; color: #333; }
+        .plugin-count { font-size: 20px; font-weight: bold; color: #11998e; }
+        .plugin-count-label { font-size: 12px; color: #888; margin-left: 4px; }
     </style>
 </head>
 <body>
     <div class="container">
         <div class="header">
-            <h1>{title}</h1>
-            <div class="subtitle">{subtitle}</div>
+            <h1>$title</h1>
+            <div class="subtitle">$subtitle</div>
         </div>
-        <div class="stats-grid">{items_html}</div>
-        <div class="footer">CathayBot Statistics · {time_str}</div>
+        <ul class="plugin-list">$items_html</ul>
+        <div class="footer">CathayBot Statistics · $time_str</div>
     </div>
 </body>
-</html>'''
+</html>''')
 
 
 def _build_plugin_stat_html(title: str, subtitle: str, items: list[dict]) -> str:
     """构建插件统计 HTML"""
     time_str = datetime.now().strftime("%Y-%m-%d %H:%M")
 
-    items_html = ""
-    if items:
-        for item in items:
-            items_html += f'''
+    fragments = [
+        f'''
             <li class="plugin-item">
                 <div class="plugin-icon">🔌</div>
                 <div class="plugin-info">
-                    <div class="plugin-name">{item["name"]}</div>
+                    <div class="plugin-name">{_esc(item["name"], quote=False)}</div>
                 </div>
                 <div>
                     <span class="plugin-count">{item["count"]}</span>
@@ -317,43 +560,16 @@ def _build_plugin_stat_html(title: str, subtitle: str, items: list[dict]) -> str
                 </div>
             </li>
             '''
-    else:
-        items_html = '<div class="empty">暂无数据</div>'
+        for item in items
+    ]
+    items_html = "".join(fragments) if fragments else '<div class="empty">暂无数据</div>'
 
-    return f'''<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{ font-family: "Microsoft YaHei", "PingFang SC", sans-serif; background: linear-gradient(135deg, #11998e 0%, #38ef7d 100%); padding: 20px; min-width: 400px; }}
-        .container {{ background: white; border-radius: 16px; padding: 24px; box-shadow: 0 10px 40px rgba(0,0,0,0.2); }}
-        .header {{ text-align: center; margin-bottom: 20px; padding-bottom: 16px; border-bottom: 2px solid #f0f0f0; }}
-        .header h1 {{ font-size: 24px; color: #333; margin-bottom: 8px; }}
-        .header .subtitle {{ font-size: 14px; color: #888; }}
-        .plugin-list {{ list-style: none; }}
-        .plugin-item {{ display: flex; align-items: center; padding: 14px 16px; margin-bottom: 10px; background: #f8f9fa; border-radius: 12px; border-left: 4px solid #11998e; transition: all 0.2s; }}
-        .plugin-item:hover {{ transform: translateX(4px); box-shadow: 0 4px 12px rgba(0,0,0,0.1); }}
-        .plugin-icon {{ width: 40px; height: 40px; border-radius: 10px; background: linear-gradient(135deg, #11998e 0%, #38ef7d 100%); display: flex; align-items: center; justify-content: center; font-size: 20px; margin-right: 12px; }}
-        .plugin-info {{ flex: 1; }}
-        .plugin-name {{ font-size: 16px; font-weight: 500; color: #333; }}
-        .plugin-count {{ font-size: 20px; font-weight: bold; color: #11998e; }}
-        .plugin-count-label {{ font-size: 12px; color: #888; margin-left: 4px; }}
-        .footer {{ text-align: center; margin-top: 16px; padding-top: 16px; border-top: 1px solid #f0f0f0; font-size: 12px; color: #aaa; }}
-        .empty {{ text-align: center; padding: 40px; color: #888; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>{title}</h1>
-            <div class="subtitle">{subtitle}</div>
-        </div>
-        <ul class="plugin-list">{items_html}</ul>
-        <div class="footer">CathayBot Statistics · {time_str}</div>
-    </div>
-</body>
-</html>'''
+    return _PLUGIN_STAT_PAGE.substitute(
+        title=_esc(title, quote=False),
+        subtitle=_esc(subtitle, quote=False),
+        items_html=items_html,
+        time_str=time_str,
+    )
 
 
 def format_text_stat(title: str, subtitle: str, items: list[dict], stat_type: str = "rank") -> str:
@@ -380,10 +596,16 @@ def format_text_stat(title: str, subtitle: str, items: list[dict], stat_type: st
                 lines.append(f"{i}. {item['name']}: {item['count']} 次")
         else:
             # 排行榜：显示排名、名称、数量
+            # 先解包字段到局部变量，避免循环里重复下标查找
             for i, item in enumerate(items, 1):
-                medal = {1: "🥇", 2: "🥈", 3: "🥉"}.get(i, f"{i}.")
-                detail = f" ({item['detail']})" if item.get("detail") else ""
-                lines.append(f"{medal} {item['name']}{detail}: {item['count']}")
+                name = item["name"]
+                count = item["count"]
+                detail = item.get("detail")
+                medal = _MEDALS.get(i) or f"{i}."
+                if detail:
+                    lines.append(f"{medal} {name} ({detail}): {count}")
+                else:
+                    lines.append(f"{medal} {name}: {count}")
 
     return "\n".join(lines)
 
@@ -411,148 +633,224 @@ async def send_stat(
     else:
         img = await render_image(title, subtitle, items, stat_type)
         if img:
+            if plugin_config.image_base64:
+                # base64:// 内联直接走协议端上传，省掉临时文件读写
+                await matcher.finish(
+                    MessageSegment.image(f"base64://{base64.b64encode(img).decode('ascii')}")
+                )
             await matcher.finish(MessageSegment.image(img))
         else:
             await matcher.finish(format_text_stat(title, subtitle, items, stat_type))
 
 
-@stat_cmd.handle()
-async def handle_stat(
+# 群成员昵称缓存: (group_id, user_id) -> (过期时间戳, 昵称)。
+# 群名片变更频率远低于 /stat 查询频率，5 分钟 TTL 内重复查询
+# 不再走 OneBot 网络调用；改名/退群事件会主动失效对应条目
+_NAME_CACHE_TTL = 300
+_NAME_CACHE_MAX = 4096
+_name_cache: dict[tuple[str, str], tuple[float, str]] = {}
+
+_name_notice = on_notice(priority=99, block=False)
+
+
+@_name_notice.handle()
+async def _invalidate_name_cache(event: NoticeEvent):
+    """群名片变更/成员退群时失效昵称缓存"""
+    # OneBot v11 适配器没有群名片通知事件类，按 notice_type 识别
+    if isinstance(event, GroupDecreaseNoticeEvent) or (
+        getattr(event, "notice_type", "") == "group_card"
+    ):
+        group_id = getattr(event, "group_id", None)
+        user_id = getattr(event, "user_id", None)
+        if group_id is not None and user_id is not None:
+            _name_cache.pop((str(group_id), str(user_id)), None)
+
+
+async def _resolve_names(bot: Bot, group_id: str, user_ids: list[str]) -> dict[str, str]:
+    """并发解析一批群成员昵称
+
+    命中缓存的直接返回；未命中的 get_group_member_info 调用同时发出，
+    总耗时约等于一次往返。单个查询失败时回退为 QQ 号字符串（不缓存失败）。
+    """
+    now = time.monotonic()
+    names: dict[str, str] = {}
+    missing: list[str] = []
+    for uid in user_ids:
+        cached = _name_cache.get((group_id, uid))
+        if cached and cached[0] > now:
+            names[uid] = cached[1]
+        else:
+            missing.append(uid)
+
+    if not missing:
+        return names
+
+    async def _fetch(uid: str) -> str | None:
+        try:
+            info = await bot.get_group_member_info(group_id=int(group_id), user_id=int(uid))
+            return info.get("card") or info.get("nickname", uid)
+        except Exception:
+            return None
+
+    fetched = await asyncio.gather(*(_fetch(uid) for uid in missing))
+    if len(_name_cache) >= _NAME_CACHE_MAX:
+        _name_cache.clear()
+    expires = now + _NAME_CACHE_TTL
+    for uid, name in zip(missing, fetched):
+        if name is None:
+            names[uid] = uid
+        else:
+            names[uid] = name
+            _name_cache[(group_id, uid)] = (expires, name)
+    return names
+
+
+async def _handle_rank(
     bot: Bot,
-    event: MessageEvent,
     matcher: Matcher,
-    args: Message = CommandArg(),
+    group_id: str | None,
+    raw_mode: bool,
+    query,
+    title: str,
+    subtitle: str,
 ):
-    """处理统计命令"""
-    arg_text = args.extract_plain_text().strip()
-    arg, raw_mode = parse_raw_flag(arg_text)
+    """处理排行榜类子命令的公共逻辑"""
+    if not group_id:
+        await matcher.finish("请在群聊中使用此命令")
 
-    group_id = str(event.group_id) if isinstance(event, GroupMessageEvent) else None
-    now = datetime.now()
+    stats = await query(group_id, plugin_config.top_limit)
 
-    parts = arg.split()
-    sub_cmd = parts[0] if parts else "all"
+    names = await _resolve_names(bot, group_id, [uid for uid, _ in stats])
+    items = [
+        {"name": names[uid], "count": count, "detail": f"QQ: {uid}"}
+        for uid, count in stats
+    ]
 
-    if sub_cmd in ("today", "今日", "今天"):
-        if not group_id:
-            await matcher.finish("请在群聊中使用此命令")
+    await send_stat(matcher, title, subtitle, items, raw_mode, "rank")
 
-        stats = await StatQuery.get_group_stats_today(group_id, plugin_config.top_limit)
 
-        items = []
-        for user_id, count in stats:
-            try:
-                info = await bot.get_group_member_info(group_id=int(group_id), user_id=int(user_id))
-                name = info.get("card") or info.get("nickname", user_id)
-            except Exception:
-                name = user_id
-            items.append({"name": name, "count": count, "detail": f"QQ: {user_id}"})
+async def _handle_today(bot, event, matcher, args, group_id, raw_mode):
+    await _handle_rank(
+        bot, matcher, group_id, raw_mode,
+        StatQuery.get_group_stats_today,
+        "今日发言排行",
+        datetime.now().strftime("%Y-%m-%d"),
+    )
 
-        await send_stat(matcher, "今日发言排行", now.strftime("%Y-%m-%d"), items, raw_mode, "rank")
 
-    elif sub_cmd in ("week", "本周", "周"):
-        if not group_id:
-            await matcher.finish("请在群聊中使用此命令")
+async def _handle_week(bot, event, matcher, args, group_id, raw_mode):
+    now = datetime.now()
+    start_date = (now - timedelta(days=now.weekday())).strftime("%m-%d")
+    await _handle_rank(
+        bot, matcher, group_id, raw_mode,
+        StatQuery.get_group_stats_week,
+        "本周发言排行",
+        f"{start_date} ~ {now.strftime('%m-%d')}",
+    )
 
-        stats = await StatQuery.get_group_stats_week(group_id, plugin_config.top_limit)
 
-        items = []
-        for user_id, count in stats:
-            try:
-                info = await bot.get_group_member_info(group_id=int(group_id), user_id=int(user_id))
-                name = info.get("card") or info.get("nickname", user_id)
-            except Exception:
-                name = user_id
-            items.append({"name": name, "count": count, "detail": f"QQ: {user_id}"})
-
-        from datetime import timedelta
-        start_date = (now - timedelta(days=now.weekday())).strftime("%m-%d")
-        await send_stat(
-            matcher,
-            "本周发言排行",
-            f"{start_date} ~ {now.strftime('%m-%d')}",
-            items,
-            raw_mode,
-            "rank",
-        )
+async def _handle_month(bot, event, matcher, args, group_id, raw_mode):
+    await _handle_rank(
+        bot, matcher, group_id, raw_mode,
+        StatQuery.get_group_stats_month,
+        "本月发言排行",
+        datetime.now().strftime("%Y年%m月"),
+    )
 
-    elif sub_cmd in ("month", "本月", "月"):
-        if not group_id:
-            await matcher.finish("请在群聊中使用此命令")
 
-        stats = await StatQuery.get_group_stats_month(group_id, plugin_config.top_limit)
+async def _handle_all(bot, event, matcher, args, group_id, raw_mode):
+    await _handle_rank(
+        bot, matcher, group_id, raw_mode,
+        StatQuery.get_group_stats_all,
+        "总发言排行",
+        "全部时间",
+    )
 
-        items = []
-        for user_id, count in stats:
-            try:
-                info = await bot.get_group_member_info(group_id=int(group_id), user_id=int(user_id))
-                name = info.get("card") or info.get("nickname", user_id)
-            except Exception:
-                name = user_id
-            items.append({"name": name, "count": count, "detail": f"QQ: {user_id}"})
 
-        await send_stat(matcher, "本月发言排行", now.strftime("%Y年%m月"), items, raw_mode, "rank")
+async def _handle_plugin(bot, event, matcher, args, group_id, raw_mode):
+    stats = await StatQuery.get_plugin_stats(plugin_config.top_limit)
+    items = [{"name": name, "count": count} for name, count in stats]
+    await send_stat(matcher, "插件调用排行", "近30天", items, raw_mode, "plugin")
 
-    elif sub_cmd in ("all", "全部", "总"):
-        if not group_id:
-            await matcher.finish("请在群聊中使用此命令")
 
-        stats = await StatQuery.get_group_stats_all(group_id, plugin_config.top_limit)
+async def _handle_user(bot, event, matcher, args, group_id, raw_mode):
+    # 获取 @ 的用户
+    target_user = None
+    for seg in args:
+        if seg.type == "at":
+            target_user = str(seg.data.get("qq"))
+            break
 
-        items = []
-        for user_id, count in stats:
-            try:
-                info = await bot.get_group_member_info(group_id=int(group_id), user_id=int(user_id))
-                name = info.get("card") or info.get("nickname", user_id)
-            except Exception:
-                name = user_id
-            items.append({"name": name, "count": count, "detail": f"QQ: {user_id}"})
+    if not target_user:
+        target_user = str(event.user_id)
 
-        await send_stat(matcher, "总发言排行", "全部时间", items, raw_mode, "rank")
+    # 从查询模块获取用户统计
+    user_stats = await StatQuery.get_user_stats(target_user, group_id)
 
-    elif sub_cmd in ("plugin", "插件"):
-        stats = await StatQuery.get_plugin_stats(plugin_config.top_limit)
-        items = [{"name": name, "count": count} for name, count in stats]
-        await send_stat(matcher, "插件调用排行", "近30天", items, raw_mode, "plugin")
+    try:
+        if group_id:
+            info = await bot.get_group_member_info(group_id=int(group_id), user_id=int(target_user))
+            name = info.get("card") or info.get("nickname", target_user)
+        else:
+            info = await bot.get_stranger_info(user_id=int(target_user))
+            name = info.get("nickname", target_user)
+    except Exception:
+        name = target_user
+
+    items = [
+        {"name": "今日发言", "count": user_stats["today"]},
+        {"name": "本周发言", "count": user_stats["week"]},
+        {"name": "本月发言", "count": user_stats["month"]},
+        {"name": "总发言", "count": user_stats["total"]},
+        {"name": "近7天命令", "count": user_stats["cmd_week"]},
+    ]
+
+    location = f"本群 (QQ: {target_user})" if group_id else f"QQ: {target_user}"
+    await send_stat(matcher, f"{name} 的统计", location, items, raw_mode, "user")
+
+
+# 子命令别名归一化 + O(1) 分发表，代替逐个 if/elif 比较
+_ALIAS = (
+    {a: "today" for a in ("today", "今日", "今天")}
+    | {a: "week" for a in ("week", "本周", "周")}
+    | {a: "month" for a in ("month", "本月", "月")}
+    | {a: "all" for a in ("all", "全部", "总")}
+    | {a: "plugin" for a in ("plugin", "插件")}
+    | {a: "user" for a in ("user", "用户")}
+)
 
-    elif sub_cmd in ("user", "用户"):
-        # 获取 @ 的用户
-        target_user = None
-        for seg in args:
-            if seg.type == "at":
-                target_user = str(seg.data.get("qq"))
-                break
+_HANDLERS = {
+    "today": _handle_today,
+    "week": _handle_week,
+    "month": _handle_month,
+    "all": _handle_all,
+    "plugin": _handle_plugin,
+    "user": _handle_user,
+}
 
-        if not target_user:
-            target_user = str(event.user_id)
 
-        # 从查询模块获取用户统计
-        user_stats = await StatQuery.get_user_stats(target_user, group_id)
+@stat_cmd.handle()
+async def handle_stat(
+    bot: Bot,
+    event: MessageEvent,
+    matcher: Matcher,
+    args: Message = CommandArg(),
+):
+    """处理统计命令"""
+    arg_text = args.extract_plain_text().strip()
+    arg, raw_mode = parse_raw_flag(arg_text)
 
-        try:
-            if group_id:
-                info = await bot.get_group_member_info(group_id=int(group_id), user_id=int(target_user))
-                name = info.get("card") or info.get("nickname", target_user)
-            else:
-                info = await bot.get_stranger_info(user_id=int(target_user))
-                name = info.get("nickname", target_user)
-        except Exception:
-            name = target_user
-
-        items = [
-            {"name": "今日发言", "count": user_stats["today"]},
-            {"name": "本周发言", "count": user_stats["week"]},
-            {"name": "本月发言", "count": user_stats["month"]},
-            {"name": "总发言", "count": user_stats["total"]},
-            {"name": "近7天命令", "count": user_stats["cmd_week"]},
-        ]
+    group_id = str(event.group_id) if isinstance(event, GroupMessageEvent) else None
 
-        location = f"本群 (QQ: {target_user})" if group_id else f"QQ: {target_user}"
-        await send_stat(matcher, f"{name} 的统计", location, items, raw_mode, "user")
+    parts = arg.split()
+    sub_cmd = parts[0] if parts else "all"
 
-    else:
+    handler = _HANDLERS.get(_ALIAS.get(sub_cmd, sub_cmd))
+    if handler is None:
         await matcher.finish("未知的统计类型，请使用 /help 统计 查看用法")
 
+    await handler(bot, event, matcher, args, group_id, raw_mode)
+
 
 # ==================== 命令调用记录 ====================
 
@@ -577,16 +875,15 @@ async def setup_command_hook():
         user_id = str(event.user_id)
         date_key = get_date_key()
 
-        # 插件调用统计
-        await redis_client.hincrby(f"stat:cmd:daily:{date_key}", plugin_name, 1)
-
-        # 用户命令统计
-        await redis_client.hincrby(f"stat:cmd:user:{user_id}:daily", date_key, 1)
-
-        # 设置过期时间
-        expire_seconds = 30 * 24 * 3600  # 30天
-        await redis_client.expire(f"stat:cmd:daily:{date_key}", expire_seconds)
-        await redis_client.expire(f"stat:cmd:user:{user_id}:daily", expire_seconds)
+        # 插件调用 + 用户命令两个计数连同 TTL 合并为一次脚本调用
+        _enqueue([(
+            "eval_script",
+            (
+                _CMD_COUNTERS_SCRIPT,
+                [f"stat:cmd:daily:{date_key}", f"stat:cmd:user:{user_id}:daily"],
+                [plugin_name, date_key, _EXPIRE_CMD],
+            ),
+        )])
 
 
 # ==================== 初始化同步任务 ====================
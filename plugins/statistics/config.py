@@ -27,6 +27,9 @@ class Config(PluginConfig):
     # 默认输出模式: image / text
     default_output: str = Field(default="image", description="默认输出模式")
 
+    # 图片以 base64:// 内联发送（跳过临时文件落盘；个别适配器实现只认文件路径时可关闭）
+    image_base64: bool = Field(default=True, description="图片是否以 base64 内联发送")
+
     # 是否保存聊天记录到 Redis
     save_chat_history: bool = Field(default=True, description="是否保存聊天记录")
 
@@ -2,9 +2,9 @@
 Statistics 插件数据模型
 """
 
-from datetime import datetime
+from datetime import date, datetime
 
-from sqlalchemy import String, DateTime, Integer, Index, Date, Text
+from sqlalchemy import String, DateTime, Integer, Index, Date, Text, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from cathaybot.database.models import BaseModel
@@ -49,7 +49,8 @@ class DailyMessageStat(BaseModel):
 
     __tablename__ = "stat_daily_messages"
 
-    date: Mapped[str] = mapped_column(String(10), nullable=False)  # YYYY-MM-DD
+    # 原生 Date 列：行更小，日期范围比较走数值而非字符串
+    date: Mapped[date] = mapped_column(Date, nullable=False)
     group_id: Mapped[str] = mapped_column(String(20), nullable=False)
     user_id: Mapped[str] = mapped_column(String(20), nullable=False)
     count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
@@ -57,6 +58,14 @@ class DailyMessageStat(BaseModel):
     __table_args__ = (
         Index("ix_daily_msg_date_group", "date", "group_id"),
         Index("ix_daily_msg_user", "user_id"),
+        # 覆盖索引：排行聚合 (WHERE group_id=? AND date BETWEEN ...
+        # GROUP BY user_id) 可以 index-only 回答，不回表
+        Index(
+            "ix_daily_msg_group_date_cover",
+            "group_id",
+            "date",
+            postgresql_include=["user_id", "count"],
+        ),
     )
 
 
@@ -65,13 +74,18 @@ class DailyCommandStat(BaseModel):
 
     __tablename__ = "stat_daily_commands"
 
-    date: Mapped[str] = mapped_column(String(10), nullable=False)  # YYYY-MM-DD
+    date: Mapped[date] = mapped_column(Date, nullable=False)
     plugin_name: Mapped[str] = mapped_column(String(50), nullable=False)
     count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
 
     __table_args__ = (
         Index("ix_daily_cmd_date", "date"),
         Index("ix_daily_cmd_plugin", "plugin_name"),
+        Index(
+            "ix_daily_cmd_date_plugin_cover",
+            "date",
+            postgresql_include=["plugin_name", "count"],
+        ),
     )
 
 
@@ -127,6 +141,50 @@ class UserGroupMessageStats(BaseModel):
 
     __table_args__ = (
         Index("ix_user_group_stats", "group_id", "user_id", unique=True),
+        # 覆盖索引：总榜 Top-K (WHERE group_id=? ORDER BY total_count
+        # DESC LIMIT k) 直接按索引序取前 k 行，免全组排序、免回表
+        Index(
+            "ix_ugs_group_count_desc",
+            "group_id",
+            text("total_count DESC"),
+            postgresql_include=["user_id"],
+        ),
+    )
+
+
+class WeeklyGroupStats(BaseModel):
+    """群周发言聚合表 (同步任务滚动刷新)
+
+    周榜原本每次请求都对每日表做 7 天的 GROUP BY 聚合，
+    改为同步任务刷新一次，读侧退化为索引点查。
+    """
+
+    __tablename__ = "weekly_group_stats"
+
+    week_start: Mapped[date] = mapped_column(Date, nullable=False)
+    group_id: Mapped[str] = mapped_column(String(20), nullable=False)
+    user_id: Mapped[str] = mapped_column(String(20), nullable=False)
+    count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_weekly_stats", "week_start", "group_id", "user_id", unique=True),
+        Index("ix_weekly_stats_rank", "week_start", "group_id", "count"),
+    )
+
+
+class MonthlyGroupStats(BaseModel):
+    """群月发言聚合表 (同步任务滚动刷新)"""
+
+    __tablename__ = "monthly_group_stats"
+
+    month_start: Mapped[date] = mapped_column(Date, nullable=False)
+    group_id: Mapped[str] = mapped_column(String(20), nullable=False)
+    user_id: Mapped[str] = mapped_column(String(20), nullable=False)
+    count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_monthly_stats", "month_start", "group_id", "user_id", unique=True),
+        Index("ix_monthly_stats_rank", "month_start", "group_id", "count"),
     )
 
 
@@ -135,12 +193,22 @@ class UserGroupDailyStats(BaseModel):
 
     __tablename__ = "user_group_daily_stats"
 
-    date: Mapped[str] = mapped_column(String(10), nullable=False)  # YYYY-MM-DD
+    # 原生 Date 列：行更小，日期范围比较走数值而非字符串
+    date: Mapped[date] = mapped_column(Date, nullable=False)
     group_id: Mapped[str] = mapped_column(String(20), nullable=False)
     user_id: Mapped[str] = mapped_column(String(20), nullable=False)
     count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
 
     __table_args__ = (
         Index("ix_daily_stats", "date", "group_id", "user_id", unique=True),
-        Index("ix_daily_stats_date", "date"),
+        # 按天追加写入后日期天然物理有序，BRIN 对周/月范围扫描
+        # 只占 KB 级空间，代替独立 btree
+        Index("ix_daily_stats_date", "date", postgresql_using="brin"),
+        Index(
+            "ix_ugds_date_group_count_desc",
+            "date",
+            "group_id",
+            text("count DESC"),
+            postgresql_include=["user_id"],
+        ),
     )
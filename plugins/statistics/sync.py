@@ -5,12 +5,19 @@ Statistics 插件 - 数据同步模块
 """
 
 import asyncio
-import json
-from datetime import datetime, timedelta
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+try:
+    # 与写入侧一致：orjson 解析 UTF-8 文本约快 2-6 倍
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
 
 from nonebot import logger, get_driver
-from sqlalchemy import select
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from cathaybot.cache import redis_client
 from cathaybot.config import GlobalConfig
@@ -21,52 +28,163 @@ from .models import (
     DailyMessageStat,
     DailyCommandStat,
     ChatMessage,
+    MonthlyGroupStats,
     UserGroupMessageStats,
     UserGroupDailyStats,
+    WeeklyGroupStats,
 )
 
 # 加载配置
 plugin_config = Config.load("statistics")
 
+# 聊天记录同步每批拉取的消息条数：大群积压的列表一次 LRANGE 全量
+# 取回会产生巨型回复并让解析行堆到一个事务里，按批处理把单次
+# 往返和内存峰值都限制在常数规模
+_CHAT_SYNC_BATCH = 1000
+
 
 async def sync_stats_to_db():
     """将 Redis 统计数据同步到数据库"""
     if not GlobalConfig.redis.enabled:
         return
 
-    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    yesterday_dt = datetime.now() - timedelta(days=1)
+    yesterday = yesterday_dt.strftime("%Y-%m-%d")  # Redis key 仍是字符串
+    yesterday_date = yesterday_dt.date()  # 数据库 Date 列用原生对象
+
+    # 跨副本互斥：SET NX 抢锁，抢到的副本执行同步，其余直接跳过，
+    # 避免多实例部署时重复写库。键里带日期、不存在复用问题，TTL 给
+    # 足 48 小时——锁若在当天内过期，下面无冲突保护的 insert 会把
+    # 昨日数据整套重写一遍
+    lock_key = f"stat:sync:lock:{yesterday}"
+    got_lock = await redis_client.set(lock_key, "1", expire=172800, nx=True)
+    if not got_lock:
+        return
+
+    try:
+        await _sync_stats_locked(yesterday_date, yesterday)
+    except Exception:
+        # 同步失败时释放锁再抛出：整个事务已回滚，重试是安全的，
+        # 否则 48 小时内没有任何副本会补写昨天的数据
+        await redis_client.delete(lock_key)
+        raise
 
+    await refresh_period_stats()
+    await cleanup_user_cmd_hashes()
+    await cleanup_stat_indexes()
+
+
+async def _sync_stats_locked(yesterday_date: date, yesterday: str):
+    """持锁执行的每日统计落库（单事务，失败整体回滚）"""
     async with get_session() as session:
-        # 同步群消息统计
-        group_keys = await redis_client.keys(f"stat:msg:daily:{yesterday}:*")
-        for key in group_keys:
-            parts = key.split(":")
-            if len(parts) >= 5:
-                group_id = parts[4]
-                data = await redis_client.hgetall(key)
-
-                for user_id, count in data.items():
-                    stat = DailyMessageStat(
-                        date=yesterday,
-                        group_id=group_id,
-                        user_id=user_id,
-                        count=int(count),
-                    )
-                    session.add(stat)
+        # 同步群消息统计（先收集成行列表，再一次性批量插入，
+        # 跳过逐行 session.add 的 ORM 簿记开销）
+        msg_rows = []
+        # 写入侧维护的当日活跃群索引直接给出精确键名，无需扫描键空间
+        group_ids = sorted(await redis_client.smembers(f"stat:index:daily:{yesterday}"))
+        parsed = [(f"stat:msg:daily:{yesterday}:{gid}", gid) for gid in group_ids]
+
+        # 全部群的 Hash 走一个 Pipeline 拉取，N 次往返合并为 1 次
+        async with redis_client.pipeline() as pipe:
+            for key, _ in parsed:
+                pipe.hgetall(key)
+            hashes = await pipe.execute()
+
+        for (key, group_id), data in zip(parsed, hashes):
+            msg_rows.extend(
+                {
+                    "date": yesterday_date,
+                    "group_id": group_id,
+                    "user_id": user_id,
+                    "count": int(count),
+                }
+                for user_id, count in data.items()
+            )
+
+        if msg_rows:
+            await session.execute(insert(DailyMessageStat), msg_rows)
 
         # 同步命令统计
         cmd_data = await redis_client.hgetall(f"stat:cmd:daily:{yesterday}")
-        for plugin_name, count in cmd_data.items():
-            stat = DailyCommandStat(
-                date=yesterday,
-                plugin_name=plugin_name,
-                count=int(count),
-            )
-            session.add(stat)
+        cmd_rows = [
+            {"date": yesterday_date, "plugin_name": plugin_name, "count": int(count)}
+            for plugin_name, count in cmd_data.items()
+        ]
+        if cmd_rows:
+            await session.execute(insert(DailyCommandStat), cmd_rows)
 
         await session.commit()
 
 
+async def refresh_period_stats():
+    """刷新周/月发言聚合表
+
+    借每日同步的互斥锁每天重算一次本周/本月的 GROUP BY 聚合，
+    排行查询只做聚合表的索引点查，不再逐请求扫描每日表。
+    """
+    today = datetime.now()
+    periods = (
+        (WeeklyGroupStats, "week_start", today - timedelta(days=today.weekday())),
+        (MonthlyGroupStats, "month_start", today.replace(day=1)),
+    )
+    async with get_session() as session:
+        for model, start_col, start in periods:
+            result = await session.execute(
+                select(
+                    UserGroupDailyStats.group_id,
+                    UserGroupDailyStats.user_id,
+                    func.sum(UserGroupDailyStats.count).label("total"),
+                )
+                .where(UserGroupDailyStats.date >= start.date())
+                .group_by(UserGroupDailyStats.group_id, UserGroupDailyStats.user_id)
+            )
+            rows = [
+                {
+                    start_col: start.date(),
+                    "group_id": row.group_id,
+                    "user_id": row.user_id,
+                    "count": int(row.total),
+                }
+                for row in result
+            ]
+            if rows:
+                stmt = pg_insert(model).values(rows)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[start_col, "group_id", "user_id"],
+                    set_={"count": stmt.excluded.count},
+                )
+                await session.execute(stmt)
+        await session.commit()
+
+
+async def cleanup_user_cmd_hashes():
+    """裁剪用户命令 Hash 中超过保留期的日期字段
+
+    stat:cmd:user:{uid}:daily 的整键 TTL 只在创建时设置，活跃用户的
+    旧日期字段不会自行过期。Redis >= 7.4 由写入脚本的 HEXPIRE 处理，
+    这里是旧版本服务端的兜底：借每日同步的互斥锁顺带 HDEL。
+    """
+    cutoff = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+    for key in await redis_client.scan_keys("stat:cmd:user:*:daily"):
+        fields = await redis_client.hgetall(key)
+        stale = [f for f in fields if f < cutoff]
+        if stale:
+            await redis_client.hdel(key, *stale)
+
+
+async def cleanup_stat_indexes():
+    """剪掉群日期索引里已过期的日期成员
+
+    stat:index:dates:{group_id} 记录某群尚存增量的日期；对应的日
+    Hash 到期消失后，索引成员也要剪掉，避免集合无限增长。
+    """
+    cutoff = (datetime.now() - timedelta(days=8)).strftime("%Y-%m-%d")
+    for key in await redis_client.scan_keys("stat:index:dates:*"):
+        stale = [d for d in await redis_client.smembers(key) if d < cutoff]
+        if stale:
+            await redis_client.srem(key, *stale)
+
+
 async def sync_chat_history_to_db():
     """将 Redis 聊天记录同步到数据库，并更新聚合统计表"""
     if not GlobalConfig.redis.enabled:
@@ -77,15 +195,15 @@ async def sync_chat_history_to_db():
 
     try:
         # 获取所有群聊消息 key
-        group_keys = await redis_client.keys("chat:group:*:messages")
-        private_keys = await redis_client.keys("chat:private:*:messages")
+        group_keys = await redis_client.scan_keys("chat:group:*:messages")
+        private_keys = await redis_client.scan_keys("chat:private:*:messages")
 
         all_keys = group_keys + private_keys
         synced_count = 0
 
         # 用于统计每个用户在每个群的消息数
-        group_user_counts = {}  # {(group_id, user_id): count}
-        daily_counts = {}  # {(date, group_id, user_id): count}
+        group_user_counts: Counter = Counter()  # {(group_id, user_id): count}
+        daily_counts: Counter = Counter()  # {(date, group_id, user_id): count}
 
         async with get_session() as session:
             for key in all_keys:
@@ -107,107 +225,127 @@ async def sync_chat_history_to_db():
                 if total_count == 0:
                     continue
 
-                # 确定需要同步的消息
-                messages_to_sync = []
-
+                # 确定需要同步的区间
                 if plugin_config.max_messages_per_chat > 0:
                     # 限制模式：只同步超出部分
                     if total_count <= plugin_config.max_messages_per_chat:
                         continue  # 没有超出，不需要同步
-
-                    # 获取超出部分的消息（从尾部开始）
-                    start_index = plugin_config.max_messages_per_chat
-                    messages_json = await redis_client.lrange(key, start_index, -1)
-                    messages_to_sync = messages_json
+                    sync_start = plugin_config.max_messages_per_chat
                 else:
                     # 不限制模式：同步所有消息，但不从 Redis 删除
-                    messages_json = await redis_client.lrange(key, 0, -1)
-                    messages_to_sync = messages_json
-
-                # 同步消息到数据库
-                for msg_json in messages_to_sync:
-                    try:
-                        msg_data = json.loads(msg_json)
-
-                        # 检查消息是否已存在
-                        existing = await session.execute(
-                            select(ChatMessage).where(ChatMessage.message_id == msg_data["id"])
+                    sync_start = 0
+
+                # 分批 LRANGE 拉取并逐批入库：每批内先整体解析，
+                # 再用一条 IN 查询批量查重，新消息收集成行列表批量
+                # 插入——单批往返 2 次，内存与事务行数都有常数上界
+                for batch_start in range(sync_start, total_count, _CHAT_SYNC_BATCH):
+                    batch_end = min(batch_start + _CHAT_SYNC_BATCH, total_count) - 1
+                    messages_json = await redis_client.lrange(key, batch_start, batch_end)
+
+                    parsed_msgs = []
+                    for msg_json in messages_json:
+                        try:
+                            parsed_msgs.append(_json_loads(msg_json))
+                        except Exception as e:
+                            logger.warning(f"解析消息失败: {e}")
+
+                    existing_ids: set[str] = set()
+                    if parsed_msgs:
+                        result = await session.execute(
+                            select(ChatMessage.message_id).where(
+                                ChatMessage.message_id.in_([m["id"] for m in parsed_msgs])
+                            )
                         )
-                        if existing.scalar_one_or_none():
-                            continue  # 已存在，跳过
+                        existing_ids = set(result.scalars())
 
-                        # 创建消息记录
-                        msg_time = datetime.fromisoformat(msg_data["time"])
-                        chat_msg = ChatMessage(
-                            message_id=msg_data["id"],
-                            conv_type=conv_type,
-                            conv_id=conv_id,
-                            user_id=msg_data["user_id"],
-                            user_name=msg_data.get("user_name"),
-                            content=msg_data["content"],
-                            raw_message=msg_data.get("raw"),
-                            timestamp=msg_time,
+                    chat_rows = []
+                    for msg_data in parsed_msgs:
+                        if msg_data["id"] in existing_ids:
+                            continue  # 已存在，跳过
+                        existing_ids.add(msg_data["id"])  # 同批内去重
+                        try:
+                            msg_time = datetime.fromisoformat(msg_data["time"])
+                            chat_rows.append({
+                                "message_id": msg_data["id"],
+                                "conv_type": conv_type,
+                                "conv_id": conv_id,
+                                "user_id": msg_data["user_id"],
+                                "user_name": msg_data.get("user_name"),
+                                "content": msg_data["content"],
+                                "raw_message": msg_data.get("raw"),
+                                "timestamp": msg_time,
+                            })
+                        except Exception as e:
+                            logger.warning(f"同步消息失败: {e}")
+                            continue
+
+                    if chat_rows:
+                        # 批量插入 + 冲突忽略：查重 SELECT 之后仍可能有并发
+                        # 写入同一 message_id，DO NOTHING 兜底而不是整批回滚。
+                        # RETURNING 只回真正落库的行，统计计数以它为准——
+                        # 既去掉了解析循环里逐条的字典自增，又保证撞冲突
+                        # 被忽略的行不会被重复计入聚合表
+                        result = await session.execute(
+                            pg_insert(ChatMessage)
+                            .on_conflict_do_nothing(index_elements=["message_id"])
+                            .values(chat_rows)
+                            .returning(ChatMessage.user_id, ChatMessage.timestamp)
                         )
-                        session.add(chat_msg)
-                        synced_count += 1
-
-                        # 统计计数
-                        group_id = conv_id
-                        user_id = msg_data["user_id"]
-                        date_key = msg_time.strftime("%Y-%m-%d")
-
-                        # 累计总数
-                        key_tuple = (group_id, user_id)
-                        group_user_counts[key_tuple] = group_user_counts.get(key_tuple, 0) + 1
-
-                        # 累计每日数
-                        daily_key = (date_key, group_id, user_id)
-                        daily_counts[daily_key] = daily_counts.get(daily_key, 0) + 1
-
-                    except Exception as e:
-                        logger.warning(f"同步消息失败: {e}")
-                        continue
+                        inserted = result.all()
+                        group_user_counts.update(
+                            (conv_id, uid) for uid, _ in inserted
+                        )
+                        daily_counts.update(
+                            (ts.date(), conv_id, uid) for uid, ts in inserted
+                        )
+                        synced_count += len(inserted)
 
                 # 如果配置了 max_messages_per_chat > 0，同步后从 Redis 中删除已同步的消息
-                if plugin_config.max_messages_per_chat > 0 and len(messages_to_sync) > 0:
+                if plugin_config.max_messages_per_chat > 0:
                     # 删除已同步的消息（从尾部删除）
                     await redis_client.ltrim(key, 0, plugin_config.max_messages_per_chat - 1)
 
-            # 更新聚合统计表
+            # 更新聚合统计表：所有行塞进一条带 VALUES 列表的 upsert，
+            # 冲突累加用 excluded 取每行自己的插入值，N 次往返合并为 1 次
             if group_user_counts:
-                for (group_id, user_id), count in group_user_counts.items():
-                    # 使用 upsert 更新或插入
-                    stmt = insert(UserGroupMessageStats).values(
-                        group_id=group_id,
-                        user_id=user_id,
-                        total_count=count,
-                        last_sync_time=datetime.now(),
-                    )
-                    # PostgreSQL upsert
-                    stmt = stmt.on_conflict_do_update(
-                        index_elements=["group_id", "user_id"],
-                        set_={
-                            "total_count": UserGroupMessageStats.total_count + count,
-                            "last_sync_time": datetime.now(),
-                        }
-                    )
-                    await session.execute(stmt)
+                now = datetime.now()
+                rows = [
+                    {
+                        "group_id": group_id,
+                        "user_id": user_id,
+                        "total_count": count,
+                        "last_sync_time": now,
+                    }
+                    for (group_id, user_id), count in group_user_counts.items()
+                ]
+                stmt = pg_insert(UserGroupMessageStats).values(rows)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["group_id", "user_id"],
+                    set_={
+                        "total_count": UserGroupMessageStats.total_count
+                        + stmt.excluded.total_count,
+                        "last_sync_time": stmt.excluded.last_sync_time,
+                    },
+                )
+                await session.execute(stmt)
 
             # 更新每日统计表
             if daily_counts:
-                for (date, group_id, user_id), count in daily_counts.items():
-                    stmt = insert(UserGroupDailyStats).values(
-                        date=date,
-                        group_id=group_id,
-                        user_id=user_id,
-                        count=count,
-                    )
-                    # PostgreSQL upsert
-                    stmt = stmt.on_conflict_do_update(
-                        index_elements=["date", "group_id", "user_id"],
-                        set_={"count": UserGroupDailyStats.count + count}
-                    )
-                    await session.execute(stmt)
+                rows = [
+                    {
+                        "date": date,
+                        "group_id": group_id,
+                        "user_id": user_id,
+                        "count": count,
+                    }
+                    for (date, group_id, user_id), count in daily_counts.items()
+                ]
+                stmt = pg_insert(UserGroupDailyStats).values(rows)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["date", "group_id", "user_id"],
+                    set_={"count": UserGroupDailyStats.count + stmt.excluded.count},
+                )
+                await session.execute(stmt)
 
             await session.commit()
 
@@ -219,14 +357,28 @@ async def sync_chat_history_to_db():
 
 
 async def start_sync_loop():
-    """启动定时同步循环"""
+    """启动定时同步循环
+
+    聊天记录同步由写入侧的脏标记驱动：没有新消息时整个
+    扫描-同步流程跳过，且休眠间隔指数退避（上限 8 倍），
+    空闲的机器人不会按固定节奏空转 Redis 和数据库。
+    统计同步每轮照常调用——未到换日时只花一次 SET NX。
+    """
+    idle_factor = 1
     while True:
-        await asyncio.sleep(plugin_config.chat_sync_interval)
+        # 对齐到下一个同步周期边界，让多副本在同一时刻竞争同一把锁，
+        # 而不是各自按启动时间漂移
+        interval = plugin_config.chat_sync_interval * idle_factor
+        await asyncio.sleep(interval - time.time() % interval)
         try:
             # 同步统计数据
             await sync_stats_to_db()
-            # 同步聊天记录
-            await sync_chat_history_to_db()
+            # 同步聊天记录（GETDEL 原子消费脏标记，多副本只有一个读到）
+            if await redis_client.getdel("stat:dirty:chat"):
+                idle_factor = 1
+                await sync_chat_history_to_db()
+            else:
+                idle_factor = min(idle_factor * 2, 8)
         except Exception as e:
             logger.error(f"同步数据失败: {e}")
 
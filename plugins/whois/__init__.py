@@ -7,18 +7,33 @@ Whois 插件 - 域名查询
 import asyncio
 import re
 import socket
+import time
+from collections import defaultdict
 from datetime import datetime
+from html import escape
 from typing import Optional
 
 import httpx
-from nonebot import on_command
+from nonebot import get_driver, on_command
 from nonebot.adapters.onebot.v11 import Bot, Message, MessageEvent, MessageSegment
 from nonebot.matcher import Matcher
 from nonebot.params import CommandArg
 from nonebot.plugin import PluginMetadata
 
 from .config import Config
-from .template import WHOIS_TEMPLATE
+
+# 可选依赖在导入时解析一次，省去每次查询的 import 分发和
+# sys.modules 查找；缺失时各自的路径优雅降级
+try:
+    import whois as _whois_mod
+except ImportError:
+    _whois_mod = None
+
+try:
+    # orjson 编解码比 httpx 走的标准库 json 快数倍，缺失时回退
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
 
 __plugin_meta__ = PluginMetadata(
     name="域名查询",
@@ -43,14 +58,129 @@ __plugin_meta__ = PluginMetadata(
 # 加载配置
 plugin_config = Config.load("whois")
 
+# 渲染相关依赖只在需要出图时加载：纯文本部署既不编译模板，
+# 也不触发 htmlrender/Playwright 的重量级导入
+_html_to_pic = None
+_WHOIS_TPL = None
+if plugin_config.default_output != "text":
+    try:
+        from nonebot_plugin_htmlrender import html_to_pic as _html_to_pic
+        # 模板在导入时编译一次：每次请求只执行编译好的字节码，
+        # 不再重复 Jinja 的词法分析/解析/编译全流程
+        from jinja2 import Environment, DictLoader, FileSystemBytecodeCache
+
+        from .template import WHOIS_TEMPLATE
+
+        # 编译结果落盘缓存：重启后按模板源码哈希直接载入字节码，
+        # 冷启动跳过整个解析/编译阶段；目录不可写则放弃缓存
+        _bcc = None
+        try:
+            from pathlib import Path
+
+            _jinja_cache_dir = Path("cache/jinja_bytecode")
+            _jinja_cache_dir.mkdir(parents=True, exist_ok=True)
+            _bcc = FileSystemBytecodeCache(directory=str(_jinja_cache_dir))
+        except OSError:
+            pass
+
+        # optimized=True 显式开启常量折叠，静态子树在编译期合并成
+        # 单个字符串常量；autoescape 维持关闭（默认值），渲染路径
+        # 完全没有 Markup.escape——注入的片段都在 Python 侧 escape 过
+        # 模板必须走 loader + get_template 路径：from_string 直接
+        # 调 compile，根本不会查字节码缓存
+        _JINJA_ENV = Environment(
+            loader=DictLoader({"whois": WHOIS_TEMPLATE}),
+            optimized=True,
+            auto_reload=False,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            bytecode_cache=_bcc,
+        )
+        _WHOIS_TPL = _JINJA_ENV.get_template("whois")
+    except ImportError:
+        _html_to_pic = None
+        _WHOIS_TPL = None
+
 # 注册命令
 whois_cmd = on_command("whois", priority=5, block=True)
 
+# 校验/清洗用的正则在导入时编译一次，每次请求直接用编译结果；
+# \Z 锚定结尾，match() 一趟就能拒绝带尾部杂质的输入
+_DOMAIN_RE = re.compile(
+    r'^(?:[a-zA-Z0-9](?:[a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]{2,}\Z'
+)
+_SCHEME_RE = re.compile(r'^https?://')
+
+_AF_INET = socket.AF_INET
+
+# 并发上限：whois RPC 占工作线程、渲染占浏览器页面，
+# 不设限时一波并发查询会打满线程池 / 撑爆 Chromium
+_whois_sem = asyncio.Semaphore(8)
+_render_sem = asyncio.Semaphore(4)
+
+# 页脚时间戳精确到秒，同一秒内的并发请求直接复用格式化结果
+_last_ts: tuple[int, str] = (0, "")
+
+
+def _now_str() -> str:
+    global _last_ts
+    s = int(time.time())
+    if _last_ts[0] != s:
+        _last_ts = (s, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    return _last_ts[1]
+
+# DNS 解析结果缓存：重复查询热门域名时跳过 getaddrinfo 的
+# 线程切换和系统调用；失败不缓存。满了整体清空，避免引入
+# 额外的 LRU 依赖（与 statistics 插件的名片缓存同一做法）
+_DNS_TTL = 300
+_DNS_CACHE_MAX = 512
+_dns_cache: dict[str, tuple[float, list[str]]] = {}
+
+# IP 归属地基本不变，缓存可以更久
+_GEO_TTL = 3600
+_GEO_CACHE_MAX = 1024
+_geo_cache: dict[str, tuple[float, dict]] = {}
+
+# whois 注册信息至多按天变化：按 (域名, 日期) 缓存成功结果，
+# 同日重复查询从数秒的注册局 RPC 变成字典命中，也不占工作线程；
+# 错误与超时不缓存，瞬时故障可自愈
+_WHOIS_CACHE_MAX = 256
+_whois_cache: dict[tuple[str, str], dict] = {}
+
+# 渲染结果缓存：同样的查询载荷直接复用拼好的 HTML，Jinja 一次都
+# 不用跑；时间戳用 __TS__ 占位，出缓存后再替换成当前时刻
+_HTML_CACHE_MAX = 256
+_html_cache: dict[tuple, str] = {}
+
+# 惰性创建的共享 HTTP 客户端：连接在多次查询间复用（keep-alive），
+# 不再每次查询新建客户端并重握手
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=5.0,
+            limits=httpx.Limits(
+                max_keepalive_connections=10, keepalive_expiry=60
+            ),
+        )
+    return _http_client
+
+
+@get_driver().on_shutdown
+async def _close_http_client():
+    """进程退出时关闭共享 HTTP 客户端，释放连接"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
 
 def is_valid_domain(domain: str) -> bool:
     """验证域名格式"""
-    pattern = r'^(?:[a-zA-Z0-9](?:[a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, domain))
+    return _DOMAIN_RE.match(domain) is not None
 
 
 def parse_raw_flag(args: str) -> tuple[str, bool]:
@@ -61,51 +191,104 @@ def parse_raw_flag(args: str) -> tuple[str, bool]:
 
 
 async def resolve_domain(domain: str) -> list[str]:
-    """解析域名的 IP 地址"""
+    """解析域名的 IP 地址（带 TTL 缓存）"""
+    now = time.monotonic()
+    cached = _dns_cache.get(domain)
+    if cached and now - cached[0] < _DNS_TTL:
+        return cached[1]
     try:
         # 使用 socket 进行 DNS 解析
         result = await asyncio.to_thread(socket.getaddrinfo, domain, None)
-        # 提取 IPv4 地址
-        ips = list(set([addr[4][0] for addr in result if addr[0] == socket.AF_INET]))
-        return ips[:5]  # 最多返回5个IP
+        # 提取 IPv4 地址：dict.fromkeys 原地去重且保留解析返回的顺序
+        # （负载均衡记录的顺序有意义），也省掉 list->set->list 的中间对象
+        ips = list(dict.fromkeys(
+            addr[4][0] for addr in result if addr[0] == _AF_INET
+        ))[:5]  # 最多返回5个IP
+        if len(_dns_cache) >= _DNS_CACHE_MAX:
+            _dns_cache.clear()
+        _dns_cache[domain] = (now, ips)
+        return ips
     except Exception:
         return []
 
 
-async def query_ip_location(ip: str) -> Optional[dict]:
-    """查询 IP 地理位置信息"""
+async def query_ip_locations_batch(ips: list[str]) -> dict[str, dict]:
+    """批量查询 IP 地理位置信息（带 TTL 缓存）
+
+    未命中缓存的 IP 合并为一次 ip-api.com /batch 请求，
+    N 个 IP 的 N 次往返收敛为 1 次。
+    """
+    now = time.monotonic()
+    locations: dict[str, dict] = {}
+    pending = []
+    for ip in ips:
+        cached = _geo_cache.get(ip)
+        if cached and now - cached[0] < _GEO_TTL:
+            locations[ip] = cached[1]
+        else:
+            pending.append(ip)
+    if not pending:
+        return locations
+
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            # 使用 ip-api.com 免费 API
-            response = await client.get(
-                f"http://ip-api.com/json/{ip}",
-                params={"lang": "zh-CN", "fields": "status,country,regionName,city,isp,org,as"}
+        # 使用 ip-api.com 免费批量 API，返回顺序与请求顺序一致
+        payload = [
+            {
+                "query": ip,
+                "fields": "status,country,regionName,city,isp,org,as",
+                "lang": "zh-CN",
+            }
+            for ip in pending
+        ]
+        client = _get_http_client()
+        if _orjson is not None:
+            response = await client.post(
+                "http://ip-api.com/batch",
+                content=_orjson.dumps(payload),
+                headers={"content-type": "application/json"},
+            )
+        else:
+            response = await client.post("http://ip-api.com/batch", json=payload)
+        if response.status_code == 200:
+            results = (
+                _orjson.loads(response.content)
+                if _orjson is not None
+                else response.json()
             )
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("status") == "success":
-                    return {
-                        "country": data.get("country", "未知"),
-                        "region": data.get("regionName", "未知"),
-                        "city": data.get("city", "未知"),
-                        "isp": data.get("isp", "未知"),
-                        "org": data.get("org", "未知"),
-                        "as": data.get("as", "未知"),
-                    }
+            for ip, data in zip(pending, results):
+                if data.get("status") != "success":
+                    continue
+                loc = {
+                    "country": data.get("country", "未知"),
+                    "region": data.get("regionName", "未知"),
+                    "city": data.get("city", "未知"),
+                    "isp": data.get("isp", "未知"),
+                    "org": data.get("org", "未知"),
+                    "as": data.get("as", "未知"),
+                }
+                if len(_geo_cache) >= _GEO_CACHE_MAX:
+                    _geo_cache.clear()
+                _geo_cache[ip] = (now, loc)
+                locations[ip] = loc
     except Exception:
         pass
-    return None
+    return locations
 
 
 async def query_whois(domain: str, timeout: int = 10) -> Optional[dict]:
     """查询域名 whois 信息，返回结构化数据"""
+    if _whois_mod is None:
+        return {"error": "缺少 python-whois 库，请安装: pip install python-whois"}
+    cache_key = (domain, time.strftime("%Y-%m-%d"))
+    cached = _whois_cache.get(cache_key)
+    if cached is not None:
+        return cached
     try:
-        import whois
-
-        result = await asyncio.wait_for(
-            asyncio.to_thread(whois.whois, domain),
-            timeout=timeout
-        )
+        async with _whois_sem:
+            result = await asyncio.wait_for(
+                asyncio.to_thread(_whois_mod.whois, domain),
+                timeout=timeout
+            )
 
         if not result:
             return None
@@ -116,15 +299,14 @@ async def query_whois(domain: str, timeout: int = 10) -> Optional[dict]:
         # 域名
         data["domain"] = domain.upper()
 
-        # 状态
-        if hasattr(result, 'status') and result.status:
-            status = result.status
+        # 状态（getattr 一次取值绑定到局部变量，省掉 hasattr 的重复属性查找）
+        status = getattr(result, 'status', None)
+        if status:
             if isinstance(status, list):
                 # 提取第一个状态，去除 URL 部分
                 status = status[0] if status else "未知"
-            # 清理状态文本
-            status = status.split()[0] if ' ' in status else status
-            data["status"] = status
+            # 清理状态文本：partition 只切第一个空格，不做整串切分
+            data["status"] = status.partition(' ')[0]
         else:
             data["status"] = "未知"
 
@@ -132,8 +314,8 @@ async def query_whois(domain: str, timeout: int = 10) -> Optional[dict]:
         data["registrar"] = getattr(result, 'registrar', None) or "未知"
 
         # 注册时间
-        if hasattr(result, 'creation_date') and result.creation_date:
-            creation = result.creation_date
+        creation = getattr(result, 'creation_date', None)
+        if creation:
             if isinstance(creation, list):
                 creation = creation[0]
             if isinstance(creation, datetime):
@@ -144,8 +326,8 @@ async def query_whois(domain: str, timeout: int = 10) -> Optional[dict]:
             data["creation_date"] = "未知"
 
         # 过期时间
-        if hasattr(result, 'expiration_date') and result.expiration_date:
-            expiration = result.expiration_date
+        expiration = getattr(result, 'expiration_date', None)
+        if expiration:
             if isinstance(expiration, list):
                 expiration = expiration[0]
             if isinstance(expiration, datetime):
@@ -167,8 +349,8 @@ async def query_whois(domain: str, timeout: int = 10) -> Optional[dict]:
             data["days_left"] = None
 
         # 更新时间
-        if hasattr(result, 'updated_date') and result.updated_date:
-            updated = result.updated_date
+        updated = getattr(result, 'updated_date', None)
+        if updated:
             if isinstance(updated, list):
                 updated = updated[0]
             if isinstance(updated, datetime):
@@ -179,8 +361,8 @@ async def query_whois(domain: str, timeout: int = 10) -> Optional[dict]:
             data["updated_date"] = "未知"
 
         # DNS 服务器
-        if hasattr(result, 'name_servers') and result.name_servers:
-            ns_list = result.name_servers
+        ns_list = getattr(result, 'name_servers', None)
+        if ns_list:
             if isinstance(ns_list, list):
                 data["name_servers"] = [ns.lower() for ns in ns_list[:5]]
             else:
@@ -192,79 +374,147 @@ async def query_whois(domain: str, timeout: int = 10) -> Optional[dict]:
         data["org"] = getattr(result, 'org', None) or "未知"
         data["country"] = getattr(result, 'country', None) or "未知"
 
+        if len(_whois_cache) >= _WHOIS_CACHE_MAX:
+            _whois_cache.clear()
+        _whois_cache[cache_key] = data
         return data
 
-    except ImportError:
-        return {"error": "缺少 python-whois 库，请安装: pip install python-whois"}
     except asyncio.TimeoutError:
         return {"error": "查询超时，请稍后重试"}
     except Exception as e:
         return {"error": f"查询失败: {str(e)}"}
 
 
+# 文本输出骨架：固定行一次 format_map 填充，可变段各自 join 一次后
+# 作为整块占位符插入，避免十几次 append 和逐行 f-string
+_TEXT_TEMPLATE = """🌐 域名信息: {domain}
+
+📊 状态: {status}
+🏢 注册商: {registrar}
+🏛️ 组织: {org}
+🌍 国家: {country}
+
+📅 注册时间: {creation_date}
+⏰ 过期时间: {expiration_date}{days_left_line}
+🔄 更新时间: {updated_date}{ns_block}{dns_block}"""
+
+
 def format_text_output(whois_data: dict, dns_data: list, ip_locations: dict) -> str:
     """格式化文本输出"""
-    lines = [f"🌐 域名信息: {whois_data.get('domain', '未知')}", ""]
-
     if "error" in whois_data:
         return f"❌ {whois_data['error']}"
 
-    # Whois 信息
-    lines.append(f"📊 状态: {whois_data.get('status', '未知')}")
-    lines.append(f"🏢 注册商: {whois_data.get('registrar', '未知')}")
-    lines.append(f"🏛️ 组织: {whois_data.get('org', '未知')}")
-    lines.append(f"🌍 国家: {whois_data.get('country', '未知')}")
-    lines.append("")
-    lines.append(f"📅 注册时间: {whois_data.get('creation_date', '未知')}")
-    lines.append(f"⏰ 过期时间: {whois_data.get('expiration_date', '未知')}")
-
-    if whois_data.get('days_left') is not None:
-        days = whois_data['days_left']
+    days_left_line = ""
+    days = whois_data.get("days_left")
+    if days is not None:
         if days > 0:
-            lines.append(f"⏳ 剩余天数: {days} 天")
+            days_left_line = f"\n⏳ 剩余天数: {days} 天"
         else:
-            lines.append(f"⚠️ 已过期 {abs(days)} 天")
-
-    lines.append(f"🔄 更新时间: {whois_data.get('updated_date', '未知')}")
+            days_left_line = f"\n⚠️ 已过期 {abs(days)} 天"
 
-    # DNS 服务器
-    if whois_data.get('name_servers'):
-        lines.append("")
-        lines.append("🖥️ DNS 服务器:")
-        for ns in whois_data['name_servers']:
-            lines.append(f"  • {ns}")
+    ns_block = ""
+    if whois_data.get("name_servers"):
+        ns_block = "\n\n🖥️ DNS 服务器:\n" + "\n".join(
+            f"  • {ns}" for ns in whois_data["name_servers"]
+        )
 
-    # DNS 解析
+    dns_block = ""
     if dns_data:
-        lines.append("")
-        lines.append("🔍 DNS 解析:")
+        parts = []
         for ip in dns_data:
-            lines.append(f"  • {ip}")
+            parts.append(f"  • {ip}")
             # IP 地理位置
-            if ip in ip_locations:
-                loc = ip_locations[ip]
-                lines.append(f"    📍 {loc['country']} {loc['region']} {loc['city']}")
-                lines.append(f"    🏢 {loc['isp']}")
+            loc = ip_locations.get(ip)
+            if loc:
+                parts.append(f"    📍 {loc['country']} {loc['region']} {loc['city']}")
+                parts.append(f"    🏢 {loc['isp']}")
+        dns_block = "\n\n🔍 DNS 解析:\n" + "\n".join(parts)
 
-    return "\n".join(lines)
+    # defaultdict 兜底缺失字段为「未知」，与原 .get(..., "未知") 等价
+    mapping = defaultdict(lambda: "未知", whois_data)
+    mapping["days_left_line"] = days_left_line
+    mapping["ns_block"] = ns_block
+    mapping["dns_block"] = dns_block
+    return _TEXT_TEMPLATE.format_map(mapping)
 
 
 async def render_image(whois_data: dict, dns_data: list, ip_locations: dict) -> bytes | None:
     """渲染图片"""
+    if _WHOIS_TPL is None or _html_to_pic is None:
+        return None
     try:
-        from nonebot_plugin_htmlrender import html_to_pic
-        from jinja2 import Template
-
-        tmpl = Template(WHOIS_TEMPLATE)
-        html = tmpl.render(
-            time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            whois=whois_data,
-            dns=dns_data,
-            ip_locations=ip_locations,
+        # 同一载荷的 HTML 只拼一次；键取参与渲染的全部字段
+        cache_key = (
+            tuple(sorted((k, v) for k, v in whois_data.items() if k != "name_servers")),
+            tuple(whois_data.get("name_servers") or []),
+            tuple(dns_data),
+            tuple(sorted((ip, tuple(sorted(loc.items()))) for ip, loc in ip_locations.items())),
         )
-        return await html_to_pic(html=html, viewport={"width": 600, "height": 100})
-    except ImportError:
-        return None
+        cached = _html_cache.get(cache_key)
+        if cached is None:
+            # 剩余天数的分档在 Python 里算好传进去，模板少跑一串
+            # if/elif 分支的解释开销
+            days_left = whois_data.get("days_left")
+            if days_left is not None:
+                bucket = (
+                    "good" if days_left > 90
+                    else "warning" if days_left > 30
+                    else "danger"
+                )
+                text = f"剩余 {days_left} 天" if days_left > 0 else f"已过期 {abs(days_left)} 天"
+                badge_html = f'<span class="days-left {bucket}">{text}</span>'
+            else:
+                badge_html = ""
+            # NS / 解析结果两个列表直接在 Python 里拼好 HTML，
+            # 模板不再逐条迭代 + 逐字段查字典
+            ns_html = "\n".join(
+                f'<div class="list-item">{escape(str(ns))}</div>'
+                for ns in whois_data.get("name_servers") or []
+            )
+            dns_rows = []
+            for ip in dns_data:
+                loc = ip_locations.get(ip)
+                row = f'<div class="ip-item"><div class="ip-address">{escape(ip)}</div>'
+                if loc:
+                    row += (
+                        f'<div class="ip-location">📍 {escape(loc["country"])} '
+                        f'{escape(loc["region"])} {escape(loc["city"])}</div>'
+                        f'<div class="ip-isp">🏢 {escape(loc["isp"])}</div>'
+                    )
+                dns_rows.append(row + "</div>")
+            cached = _WHOIS_TPL.render(
+                time="__TS__",
+                whois=whois_data,
+                badge_html=badge_html,
+                ns_html=ns_html,
+                dns_html="\n".join(dns_rows),
+            )
+            if len(_html_cache) >= _HTML_CACHE_MAX:
+                _html_cache.clear()
+            _html_cache[cache_key] = cached
+        html = cached.replace("__TS__", _now_str())
+        # 按内容行数估算视口高度，Chromium 一次布局到位，
+        # 不再因页面溢出触发重排 + 整页截图
+        est_h = 400 + 30 * (
+            len(dns_data)
+            + len(whois_data.get("name_servers", []))
+            + 3 * sum(1 for ip in dns_data if ip in ip_locations)
+        )
+        viewport = {"width": 600, "height": est_h}
+        async with _render_sem:
+            try:
+                # 1x 缩放：2x 会让像素量翻四倍，聊天图片用不上；
+                # JPEG Q85 编码更快、字节数也远小于 PNG
+                return await _html_to_pic(
+                    html=html,
+                    viewport=viewport,
+                    device_scale_factor=1,
+                    type="jpeg",
+                    quality=85,
+                )
+            except TypeError:
+                # 旧版 htmlrender 不认识 device_scale_factor/type/quality 参数
+                return await _html_to_pic(html=html, viewport=viewport)
     except Exception:
         return None
 
@@ -286,7 +536,7 @@ async def handle_whois(
     domain, raw_mode = parse_raw_flag(arg_text)
 
     # 移除可能的协议前缀
-    domain = re.sub(r'^https?://', '', domain)
+    domain = _SCHEME_RE.sub('', domain, count=1)
     # 移除可能的路径
     domain = domain.split('/')[0]
     # 移除可能的端口
@@ -299,20 +549,17 @@ async def handle_whois(
     # 发送查询提示
     # await matcher.send(f"🔍 正在查询域名: {domain}")
 
-    # 并行执行查询
-    whois_task = query_whois(domain, timeout=plugin_config.timeout)
-    dns_task = resolve_domain(domain)
-
-    whois_data, dns_data = await asyncio.gather(whois_task, dns_task)
-
-    # 查询 IP 地理位置
-    ip_locations = {}
-    if dns_data:
-        location_tasks = [query_ip_location(ip) for ip in dns_data]
-        locations = await asyncio.gather(*location_tasks)
-        for ip, loc in zip(dns_data, locations):
-            if loc:
-                ip_locations[ip] = loc
+    # 并行执行查询：DNS 解析完立即接批量归属地查询，
+    # 整条链路与（通常更慢的）whois RPC 并发，归属地耗时被完全遮蔽
+    async def _dns_and_geo() -> tuple[list[str], dict[str, dict]]:
+        ips = await resolve_domain(domain)
+        locs = await query_ip_locations_batch(ips) if ips else {}
+        return ips, locs
+
+    whois_data, (dns_data, ip_locations) = await asyncio.gather(
+        query_whois(domain, timeout=plugin_config.timeout),
+        _dns_and_geo(),
+    )
 
     # 检查是否有错误
     if whois_data and "error" in whois_data:
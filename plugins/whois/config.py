@@ -3,9 +3,16 @@ Whois 插件配置
 """
 
 from pathlib import Path
+from typing import ClassVar
 from pydantic import BaseModel
 import yaml
 
+try:
+    # libyaml 可用时走 C 解析器，比纯 Python SafeLoader 快一个量级
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
 
 class Config(BaseModel):
     """Whois 插件配置"""
@@ -15,12 +22,20 @@ class Config(BaseModel):
     max_length: int = 2000  # 最大返回字符数
     default_output: str = "image"  # 默认输出模式: image / text
 
+    _cache: ClassVar[dict[str, "Config"]] = {}
+
     @classmethod
     def load(cls, plugin_name: str) -> "Config":
-        """加载插件配置"""
+        """加载插件配置（同名配置只读盘解析一次）"""
+        cached = cls._cache.get(plugin_name)
+        if cached is not None:
+            return cached
         config_path = Path(f"configs/plugins/{plugin_name}.yaml")
         if config_path.exists():
             with open(config_path, "r", encoding="utf-8") as f:
-                data = yaml.safe_load(f) or {}
-                return cls(**data)
-        return cls()
+                data = yaml.load(f, Loader=_YamlLoader) or {}
+                config = cls(**data)
+        else:
+            config = cls()
+        cls._cache[plugin_name] = config
+        return config